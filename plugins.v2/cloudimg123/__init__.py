@@ -1,7 +1,7 @@
 from typing import Any, List, Dict, Tuple, Optional
+import base64
 import json
-import os
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from pathlib import Path
 
 from app.core.config import settings
@@ -10,12 +10,14 @@ from app.log import logger
 from app.plugins import _PluginBase
 from app.schemas.types import EventType
 from starlette.requests import Request
-from starlette.responses import FileResponse, StreamingResponse
-from fastapi import UploadFile, Form
+from starlette.responses import FileResponse, JSONResponse, Response, StreamingResponse
+from fastapi import File, UploadFile, Form
 
 from .core.api_client import CloudAPI123
 from .core.upload_manager import UploadManager
 from .core.history_manager import HistoryManager
+from .core.ingest import spool_upload
+from .core.link_formats import LinkFormatter
 
 
 class CloudImg123(_PluginBase):
@@ -44,6 +46,13 @@ class CloudImg123(_PluginBase):
     _client_secret = ""
     _history_limit = 50
     _debug = False
+    _thumbnail_concurrency = 4
+    _thumbnail_cache_max_mb = 200
+    _thumbnail_cache_max_count = 0
+    _upload_concurrency = 3
+    _api_rate_limit = 10
+    # 自定义链接模板，每行一条"名称=模板"
+    _link_templates = ""
     
     # 核心组件
     _api = None
@@ -53,11 +62,21 @@ class CloudImg123(_PluginBase):
     # 数据目录
     _config_path = None
 
+    # 缩略图按file_id缓存、内容不变，允许浏览器长期缓存（需鉴权，仅私有缓存）
+    THUMBNAIL_CACHE_CONTROL = "private, max-age=2592000"
+    # 图表接口单次最多返回的天数
+    MAX_CHART_DAYS = 3660
+
     def init_plugin(self, config: dict = None):
         """
         初始化插件
         """
         try:
+            # 重新初始化时先关闭旧组件：落盘并关闭历史数据库、取消延迟写入定时器、关闭HTTP会话，
+            # 避免旧定时器稍后用过期数据覆盖新实例写入的记录
+            if self._api or self._history_manager:
+                self.stop_service()
+
             # 处理配置
             if config:
                 self._enabled = config.get("enabled", False)
@@ -65,6 +84,12 @@ class CloudImg123(_PluginBase):
                 self._client_secret = config.get("client_secret", "")
                 self._history_limit = config.get("history_limit", 50)
                 self._debug = config.get("debug", False)
+                self._thumbnail_concurrency = int(config.get("thumbnail_concurrency") or 4)
+                self._thumbnail_cache_max_mb = int(config.get("thumbnail_cache_max_mb", 200) or 0)
+                self._thumbnail_cache_max_count = int(config.get("thumbnail_cache_max_count", 0) or 0)
+                self._upload_concurrency = int(config.get("upload_concurrency") or 3)
+                self._api_rate_limit = float(config.get("api_rate_limit", 10) or 0)
+                self._link_templates = config.get("link_templates") or ""
 
             # 设置配置目录（使用/config/plugins/cloudimg123）
             if hasattr(settings, 'CONFIG_PATH'):
@@ -88,17 +113,27 @@ class CloudImg123(_PluginBase):
                         config_path=self._config_path,
                         debug=self._debug
                     )
+                    # 每个主机每秒最多发起的请求数（0表示不限速）
+                    self._api.set_rate_limit(self._api_rate_limit)
                     
                     # 初始化历史管理器
                     self._history_manager = HistoryManager(
                         config_path=self._config_path,
-                        limit=0 if self._history_limit >= 200 else self._history_limit
+                        limit=0 if self._history_limit >= 200 else self._history_limit,
+                        thumbnail_concurrency=self._thumbnail_concurrency,
+                        link_templates=LinkFormatter.parse_templates(self._link_templates)
+                    )
+                    # 缩略图缓存容量上限（0表示不限制）
+                    self._history_manager.thumbnail_manager.set_cache_limits(
+                        max_bytes=self._thumbnail_cache_max_mb * 1024 * 1024,
+                        max_entries=self._thumbnail_cache_max_count
                     )
                     
                     # 初始化上传管理器
                     self._upload_manager = UploadManager(
                         api_client=self._api,
-                        history_manager=self._history_manager
+                        history_manager=self._history_manager,
+                        upload_concurrency=self._upload_concurrency
                     )
                     
                     logger.info(f"[CloudImg123] 插件初始化成功")
@@ -152,13 +187,21 @@ class CloudImg123(_PluginBase):
                 "summary": "上传图片",
                 "description": "上传图片到123云盘并返回各种格式链接",
             },
+            {
+                "path": "/upload/batch",
+                "endpoint": self.upload_images_batch,
+                "methods": ["POST"],
+                "auth": "bear",
+                "summary": "批量上传图片",
+                "description": "一次上传多张图片，并发上传到123云盘，结果按文件顺序返回",
+            },
             {
                 "path": "/history",
                 "endpoint": self.get_history,
                 "methods": ["GET"],
                 "auth": "bear",
                 "summary": "获取上传历史",
-                "description": "获取用户上传历史记录",
+                "description": "获取用户上传历史记录，支持游标分页（cursor/limit）、字段选择（fields）以及按文件名和日期过滤",
             },
             {
                 "path": "/statistics",
@@ -200,6 +243,14 @@ class CloudImg123(_PluginBase):
                 "summary": "批量删除记录",
                 "description": "接收JSON格式的文件ID列表，批量删除对应的历史记录",
             },
+            {
+                "path": "/relink",
+                "endpoint": self.relink_records,
+                "methods": ["POST"],
+                "auth": "bear",
+                "summary": "刷新下载链接",
+                "description": "批量获取文件的最新下载链接并更新历史记录，file_ids为空时处理全部记录",
+            },
             {
                 "path": "/test_connection",
                 "endpoint": self.test_connection,
@@ -222,7 +273,15 @@ class CloudImg123(_PluginBase):
                 "methods": ["POST"],
                 "auth": "bear",
                 "summary": "生成所有缩略图",
-                "description": "为所有历史记录生成缩略图",
+                "description": "在后台并发为所有历史记录生成缩略图",
+            },
+            {
+                "path": "/thumbnail/progress",
+                "endpoint": self.get_thumbnail_progress,
+                "methods": ["GET"],
+                "auth": "bear",
+                "summary": "缩略图生成进度",
+                "description": "查询批量缩略图生成任务的进度",
             },
             {
                 "path": "/thumbnail/generate",
@@ -232,6 +291,22 @@ class CloudImg123(_PluginBase):
                 "summary": "生成单个缩略图",
                 "description": "为指定文件生成缩略图",
             },
+            {
+                "path": "/thumbnail/cache_info",
+                "endpoint": self.get_thumbnail_cache_info,
+                "methods": ["GET"],
+                "auth": "bear",
+                "summary": "缩略图缓存信息",
+                "description": "获取缩略图缓存的占用、容量上限以及命中、未命中和淘汰计数",
+            },
+            {
+                "path": "/thumbnails",
+                "endpoint": self.get_thumbnails_batch,
+                "methods": ["GET"],
+                "auth": "bear",
+                "summary": "批量获取缩略图",
+                "description": "按逗号分隔的file_ids一次返回多个缩略图（打包二进制或JSON）",
+            },
             {
                 "path": "/thumbnail/{file_path:path}",
                 "endpoint": self.serve_thumbnail,
@@ -252,6 +327,12 @@ class CloudImg123(_PluginBase):
             "client_id": "",
             "client_secret": "",
             "history_limit": 50,
+            "thumbnail_concurrency": 4,
+            "thumbnail_cache_max_mb": 200,
+            "thumbnail_cache_max_count": 0,
+            "upload_concurrency": 3,
+            "api_rate_limit": 10,
+            "link_templates": "",
             "debug": False
         } 
 
@@ -287,40 +368,125 @@ class CloudImg123(_PluginBase):
                 return {"success": False, "message": "文件名缺失"}
 
             logger.info(f"[CloudImg123] 开始处理上传文件: {filename}, 文件哈希: {file_hash}")
+
+            # Known content: answer from the hash index and skip spooling, hashing and the 123pan upload
+            # (Starlette has already parsed the multipart body by the time this runs)
+            if file_hash:
+                duplicate = self._upload_manager.check_duplicate(file_hash=file_hash, filename=filename)
+                if duplicate:
+                    return duplicate
             
-            # Save temporary file from UploadFile
-            import tempfile
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f"_{filename}") as temp_file:
-                # Read content from UploadFile asynchronously
-                content = await file.read()
-                temp_file.write(content)
-                temp_file_path = temp_file.name
-            
+            # Spool UploadFile to a temp file in chunks, hashing and sniffing the header in the same pass
+            spool = await spool_upload(file, filename)
+
             try:
-                # Call upload manager with temp file path, filename, and file hash
-                result = await self._upload_manager.upload_image(temp_file_path, filename, file_hash)
-                
+                # Call upload manager with temp file path, filename, file hash and the precomputed digest
+                result = await self._upload_manager.upload_image(spool.path, filename, file_hash, spool=spool)
+
                 if result.get("success"):
                     logger.info(f"[CloudImg123] 文件上传成功: {result.get('filename')}")
                 else:
                     logger.error(f"[CloudImg123] 文件上传失败: {result.get('message')}")
-                    
+
                 return result
-                
+
             finally:
                 # Clean up temporary file
-                try:
-                    os.unlink(temp_file_path)
-                except Exception as e:
-                    logger.warning(f"[CloudImg123] 清理临时文件失败: {temp_file_path}, {str(e)}")
+                spool.cleanup()
             
         except Exception as e:
             logger.error(f"[CloudImg123] 上传图片异常: {str(e)}")
             return {"success": False, "message": f"上传异常: {str(e)}"}
 
-    def get_history(self, limit: int = None, with_thumbnails: bool = True) -> dict:
+    async def upload_images_batch(self, files: List[UploadFile] = File(...),
+                                  file_hashes: List[str] = Form(None)) -> dict:
+        """
+        批量上传图片API接口 - 多个文件并发上传，结果与files顺序一致
+
+        :param file_hashes: 可选，与files一一对应的文件哈希，用于秒级去重
+        """
+        try:
+            logger.info(f"[CloudImg123] 收到批量上传请求，文件数量: {len(files or [])}")
+            
+            if not self._upload_manager:
+                logger.error(f"[CloudImg123] 上传管理器未初始化")
+                return {"success": False, "message": "插件未正确初始化"}
+
+            if not files:
+                return {"success": False, "message": "没有上传的文件"}
+
+            file_hashes = list(file_hashes or [])
+            results: List[Optional[dict]] = [None] * len(files)
+            pending = []
+            spools = []
+
+            try:
+                for index, file in enumerate(files):
+                    filename = file.filename
+                    file_hash = file_hashes[index] if index < len(file_hashes) and file_hashes[index] else None
+                    if not filename:
+                        results[index] = {"success": False, "message": "文件名缺失", "index": index}
+                        continue
+
+                    # 已知内容直接由哈希索引返回，无需读取文件
+                    if file_hash:
+                        duplicate = self._upload_manager.check_duplicate(file_hash=file_hash, filename=filename)
+                        if duplicate:
+                            duplicate["index"] = index
+                            results[index] = duplicate
+                            continue
+
+                    spool = await spool_upload(file, filename)
+                    spools.append(spool)
+                    pending.append((index, {
+                        "file_path": spool.path,
+                        "filename": filename,
+                        "file_hash": file_hash,
+                        "spool": spool
+                    }))
+
+                if pending:
+                    batch = await self._upload_manager.upload_multiple_images([item for _, item in pending])
+                    if not batch.get("success"):
+                        return batch
+                    for (index, _), result in zip(pending, batch["data"]["results"]):
+                        result["index"] = index
+                        results[index] = result
+
+            finally:
+                # Clean up temporary files
+                for spool in spools:
+                    spool.cleanup()
+
+            success_count = sum(1 for result in results if result and result.get("success"))
+            logger.info(f"[CloudImg123] 批量上传完成，成功: {success_count}/{len(files)}")
+            return {
+                "success": True,
+                "message": f"批量上传完成，成功 {success_count}/{len(files)} 个文件",
+                "data": {
+                    "total": len(files),
+                    "success_count": success_count,
+                    "results": results
+                }
+            }
+
+        except Exception as e:
+            logger.error(f"[CloudImg123] 批量上传异常: {str(e)}")
+            return {"success": False, "message": f"批量上传异常: {str(e)}"}
+
+    def get_history(self, limit: int = None, with_thumbnails: bool = True, cursor: str = None,
+                    fields: str = None, filename: str = None, start: str = None, end: str = None,
+                    file_id: str = None) -> dict:
         """
         获取上传历史API接口
+
+        :param limit: 每页条数，缺省为历史记录保存数量（0表示全部）
+        :param cursor: 上一页返回的next_cursor，用于获取下一页
+        :param fields: 逗号分隔的返回字段，如"file_id,filename,thumbnail_url"
+        :param filename: 按文件名过滤（包含，不区分大小写）
+        :param start: 上传日期起始（YYYY-MM-DD，含）
+        :param end: 上传日期结束（YYYY-MM-DD，含）
+        :param file_id: 只获取指定file_id的记录
         """
         try:
             if not self._history_manager:
@@ -328,15 +494,30 @@ class CloudImg123(_PluginBase):
                 return {"success": False, "message": "插件未正确初始化"}
 
             history_limit = limit or self._history_limit
+            field_list = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+
+            try:
+                start_date, end_date = self._parse_date_range(start, end)
+                page = self._history_manager.query_history(
+                    cursor=cursor,
+                    limit=history_limit,
+                    fields=field_list,
+                    filename=filename,
+                    start=start_date,
+                    end=end_date,
+                    file_id=file_id,
+                    with_thumbnails=with_thumbnails
+                )
+            except ValueError as e:
+                return {"success": False, "message": str(e)}
             
-            # 根据参数决定是否返回缩略图信息
-            if with_thumbnails:
-                history = self._history_manager.get_history_with_thumbnails(limit=history_limit)
-            else:
-                history = self._history_manager.get_history(limit=history_limit)
-            
-            logger.info(f"[CloudImg123] 获取历史记录，数量: {len(history)}, 缩略图: {with_thumbnails}")
-            return {"success": True, "data": history}
+            logger.info(f"[CloudImg123] 获取历史记录，数量: {len(page['items'])}, 缩略图: {with_thumbnails}, 还有更多: {page['has_more']}")
+            return {
+                "success": True,
+                "data": page["items"],
+                "next_cursor": page["next_cursor"],
+                "has_more": page["has_more"]
+            }
             
         except Exception as e:
             logger.error(f"[CloudImg123] 获取历史记录异常: {str(e)}")
@@ -384,6 +565,12 @@ class CloudImg123(_PluginBase):
         """
         try:
             logger.info(f"[CloudImg123] 插件正在停止")
+            # 关闭共享HTTP会话
+            if self._api:
+                self._api.close()
+            # 关闭历史记录存储
+            if self._history_manager:
+                self._history_manager.close()
             # 清理资源
             self._api = None
             self._upload_manager = None
@@ -391,9 +578,12 @@ class CloudImg123(_PluginBase):
         except Exception as e:
             logger.error(f"[CloudImg123] 插件停止异常: {str(e)}")
 
-    def get_statistics(self) -> dict:
+    def get_statistics(self, start: str = None, end: str = None) -> dict:
         """
         获取统计信息 API接口
+
+        :param start: 可选，范围统计起始日期（YYYY-MM-DD，含）
+        :param end: 可选，范围统计结束日期（YYYY-MM-DD，含），缺省为今天
         """
         try:
             if not self._history_manager:
@@ -408,29 +598,12 @@ class CloudImg123(_PluginBase):
                     }
                 }
 
-            stats = self._history_manager.get_statistics()
-            
-            # 计算今日上传数量
-            today_uploads = 0
-            history = self._history_manager.get_history(limit=100)  # 获取最近100条记录
-            today = datetime.now().date()
-            
-            for record in history:
-                try:
-                    # 处理不同的时间格式
-                    upload_time_str = record['upload_time']
-                    
-                    # 如果时间字符串包含时区信息（Z或+/-），需要特殊处理
-                    if 'Z' in upload_time_str:
-                        upload_time_str = upload_time_str.replace('Z', '+00:00')
-                    
-                    # 尝试解析ISO格式时间，处理包含微秒的情况
-                    upload_date = datetime.fromisoformat(upload_time_str).date()
-                    if upload_date == today:
-                        today_uploads += 1
-                except (ValueError, TypeError) as e:
-                    logger.warning(f"[CloudImg123] 解析时间失败: {record['upload_time']}, 错误: {str(e)}")
-                    continue
+            try:
+                start_date, end_date = self._parse_date_range(start, end)
+            except ValueError as e:
+                return {"success": False, "message": str(e)}
+
+            stats = self._history_manager.get_statistics(start=start_date, end=end_date)
             
             # 计算平均大小
             average_size = stats['total_size'] // stats['total_count'] if stats['total_count'] > 0 else 0
@@ -438,9 +611,12 @@ class CloudImg123(_PluginBase):
             result = {
                 "totalUploads": int(stats['total_count']) if stats['total_count'] else 0,
                 "totalSize": int(stats['total_size']) if stats['total_size'] else 0,
-                "todayUploads": int(today_uploads),
+                "todayUploads": int(stats['today_count']),
                 "averageSize": int(average_size)
             }
+            if "range_count" in stats:
+                result["rangeUploads"] = int(stats['range_count'])
+                result["rangeSize"] = int(stats['range_size'])
             
             logger.info(f"[CloudImg123] 获取统计信息成功: {result}")
             return {"success": True, "data": result}
@@ -508,48 +684,59 @@ class CloudImg123(_PluginBase):
             logger.error(f"[CloudImg123] 获取系统状态异常: {str(e)}")
             return {"success": False, "message": f"获取状态异常: {str(e)}"}
 
-    def get_chart_data(self, days: int = 7) -> dict:
+    def get_chart_data(self, days: int = 7, start: str = None, end: str = None) -> dict:
         """
         获取图表数据 API接口
+
+        :param days: 未指定start时，统计截至end（缺省为今天）的最近天数
+        :param start: 可选，起始日期（YYYY-MM-DD，含）
+        :param end: 可选，结束日期（YYYY-MM-DD，含）
         """
         try:
             if not self._history_manager:
                 logger.error(f"[CloudImg123] 历史管理器未初始化")
                 return {"success": False, "message": "插件未正确初始化"}
 
-            # 获取历史记录
-            history = self._history_manager.get_history(limit=500)  # 获取足够的记录
-            
-            # 生成指定天数的数据
-            chart_data = []
-            today = datetime.now().date()
-            
-            for i in range(days):
-                target_date = today - timedelta(days=days - 1 - i)
-                uploads_count = 0
-                
-                for record in history:
-                    try:
-                        upload_date = datetime.fromisoformat(record.upload_time.replace('Z', '+00:00')).date()
-                        if upload_date == target_date:
-                            uploads_count += 1
-                    except:
-                        continue
-                
-                chart_data.append({
-                    "date": target_date.strftime('%Y-%m-%d'),
-                    "uploads": uploads_count
-                })
+            try:
+                start_date, end_date = self._parse_date_range(start, end)
+            except ValueError as e:
+                return {"success": False, "message": str(e)}
+
+            end_date = end_date or datetime.now().date()
+            if start_date is None:
+                start_date = end_date - timedelta(days=max(int(days), 1) - 1)
+
+            # 限制单次返回的天数，避免超大范围生成过多数据点
+            if (end_date - start_date).days + 1 > self.MAX_CHART_DAYS:
+                return {"success": False, "message": f"日期范围不能超过 {self.MAX_CHART_DAYS} 天"}
+
+            # 每天的数量直接取自增量维护的按日聚合
+            chart_data = self._history_manager.get_daily_counts(start_date, end_date)
             
             result = {"chart": chart_data}
             
-            logger.info(f"[CloudImg123] 获取图表数据成功，天数: {days}")
+            logger.info(f"[CloudImg123] 获取图表数据成功，范围: {start_date} ~ {end_date}")
             return {"success": True, "data": result}
             
         except Exception as e:
             logger.error(f"[CloudImg123] 获取图表数据异常: {str(e)}")
             return {"success": False, "message": f"获取图表异常: {str(e)}"}
 
+    @staticmethod
+    def _parse_date_range(start: str = None, end: str = None) -> Tuple[Optional[date], Optional[date]]:
+        """
+        解析YYYY-MM-DD格式的日期范围参数，格式错误或起始晚于结束时抛出ValueError
+        """
+        try:
+            start_date = date.fromisoformat(start) if start else None
+            end_date = date.fromisoformat(end) if end else None
+        except ValueError:
+            raise ValueError("日期格式错误，应为YYYY-MM-DD")
+
+        if start_date and end_date and start_date > end_date:
+            raise ValueError("起始日期不能晚于结束日期")
+        return start_date, end_date
+
     
     async def delete_multiple_records(self, request: Request) -> dict:
         """
@@ -586,53 +773,90 @@ class CloudImg123(_PluginBase):
                 logger.error(f"[CloudImg123] 解析请求JSON失败: {str(e)}")
                 return {"success": False, "message": "请求格式错误"}
             
-            # 执行批量删除
-            deleted_count = 0
-            failed_items = []
-            
-            for file_id in file_ids:
-                try:
-                    logger.info(f"[CloudImg123] 正在删除文件: {file_id}")
-                    
-                    # 通过file_id查找记录
-                    record = self._history_manager.get_record_by_file_id(file_id)
-                    if record:
-                        logger.info(f"[CloudImg123] 找到记录: {record.filename} (ID: {record.id})")
-                        
-                        # 删除记录
-                        if self._history_manager.delete_record(record.id):
-                            deleted_count += 1
-                            logger.info(f"[CloudImg123] 删除成功: {record.filename}")
-                        else:
-                            logger.error(f"[CloudImg123] 删除失败: {record.filename}")
-                            failed_items.append(file_id)
-                    else:
-                        logger.warning(f"[CloudImg123] 未找到文件记录: {file_id}")
-                        failed_items.append(file_id)
-                        
-                except Exception as e:
-                    logger.error(f"[CloudImg123] 删除文件异常 {file_id}: {str(e)}")
-                    failed_items.append(file_id)
+            # 执行批量删除（一次定位、一次落盘，缩略图并行删除）
+            outcome = await self._history_manager.delete_many(file_ids)
+            failed_items = [item["file_id"] for item in outcome["results"] if not item["success"]]
             
             # 返回详细结果
             result = {
                 "success": True,
-                "message": f"删除完成，成功: {deleted_count}/{len(file_ids)}",
+                "message": f"删除完成，成功: {outcome['deleted']}/{outcome['total']}",
                 "data": {
-                    "total": len(file_ids),
-                    "deleted": deleted_count,
-                    "failed": len(failed_items),
-                    "failed_items": failed_items
+                    "total": outcome["total"],
+                    "deleted": outcome["deleted"],
+                    "failed": outcome["failed"],
+                    "failed_items": failed_items,
+                    "results": outcome["results"]
                 }
             }
             
-            logger.info(f"[CloudImg123] 批量删除完成: {result}")
+            logger.info(f"[CloudImg123] 批量删除完成: {result['message']}")
             return result
             
         except Exception as e:
             logger.error(f"[CloudImg123] 批量删除异常: {str(e)}")
             return {"success": False, "message": f"删除异常: {str(e)}"}
 
+    async def relink_records(self, request: Request) -> dict:
+        """
+        刷新下载链接 API接口（POST方法）
+        接收JSON格式的文件ID列表（为空时处理全部记录），批量查询下载链接并更新历史记录
+        """
+        try:
+            if not self._api or not self._history_manager:
+                logger.error(f"[CloudImg123] 插件未正确初始化")
+                return {"success": False, "message": "插件未正确初始化"}
+
+            try:
+                data = await request.json()
+            except Exception:
+                data = {}
+            data = data if isinstance(data, dict) else {}
+
+            file_ids = data.get("file_ids") or []
+            if isinstance(file_ids, str):
+                file_ids = [file_ids]
+            if not file_ids:
+                page = self._history_manager.query_history(fields=["file_id"], with_thumbnails=False)
+                file_ids = [item["file_id"] for item in page["items"] if item.get("file_id")]
+            refresh = bool(data.get("refresh", False))
+
+            logger.info(f"[CloudImg123] 开始刷新下载链接，共 {len(file_ids)} 个文件，忽略缓存: {refresh}")
+            resolved = await self._api.resolve_download_urls(file_ids, refresh=refresh)
+            changed = set(self._history_manager.update_links(
+                {file_id: result for file_id, result in resolved.items() if result.get("success")}
+            ))
+
+            results = []
+            for file_id, result in resolved.items():
+                if result.get("success"):
+                    results.append({
+                        "file_id": file_id,
+                        "success": True,
+                        "download_url": result["download_url"],
+                        "changed": file_id in changed
+                    })
+                else:
+                    results.append({"file_id": file_id, "success": False, "message": result.get("message")})
+
+            succeeded = sum(1 for item in results if item["success"])
+            message = f"刷新完成，成功: {succeeded}/{len(results)}，链接变化: {len(changed)}"
+            logger.info(f"[CloudImg123] {message}")
+            return {
+                "success": True,
+                "message": message,
+                "data": {
+                    "total": len(results),
+                    "resolved": succeeded,
+                    "changed": len(changed),
+                    "results": results
+                }
+            }
+
+        except Exception as e:
+            logger.error(f"[CloudImg123] 刷新下载链接异常: {str(e)}")
+            return {"success": False, "message": f"刷新下载链接异常: {str(e)}"}
+
     def test_connection(self, request: Request) -> dict:
         """
         测试API连接 API接口
@@ -804,6 +1028,25 @@ class CloudImg123(_PluginBase):
                 "failed": 0
             }
 
+    def get_thumbnail_progress(self) -> dict:
+        """
+        查询批量缩略图生成进度 API接口
+        """
+        try:
+            if not self._history_manager:
+                logger.error(f"[CloudImg123] 历史管理器未初始化")
+                return {"success": False, "message": "插件未正确初始化"}
+
+            progress = self._history_manager.get_thumbnail_progress()
+            if progress is None:
+                return {"success": True, "message": "暂无缩略图生成任务", "data": None}
+
+            return {"success": True, "data": progress}
+
+        except Exception as e:
+            logger.error(f"[CloudImg123] 获取缩略图生成进度异常: {str(e)}")
+            return {"success": False, "message": f"获取缩略图生成进度异常: {str(e)}"}
+
     def get_thumbnail_cache_info(self) -> dict:
         """
         获取缩略图缓存信息 API接口
@@ -822,90 +1065,140 @@ class CloudImg123(_PluginBase):
             logger.error(f"[CloudImg123] 获取缩略图缓存信息异常: {str(e)}")
             return {"success": False, "message": f"获取缓存信息异常: {str(e)}"}
 
-    def serve_thumbnail(self, file_path: str) -> dict:
+    def serve_thumbnail(self, file_path: str, request: Request, raw: bool = False,
+                        size: int = None, fmt: str = None):
         """
         提供缩略图文件服务
+
+        请求raw=true或Accept偏好图片类型时直接返回文件内容（FileResponse），
+        否则返回兼容旧版前端的base64 JSON；两种方式都带ETag和Cache-Control，支持If-None-Match返回304。
+        请求默认文件名{file_id}.webp时，可通过size（64/200/480）、fmt（webp/avif）和Accept选择变体
         """
         try:
             if not self._history_manager:
                 logger.error(f"[CloudImg123] 历史管理器未初始化")
                 return {"success": False, "message": "插件未正确初始化"}
 
-            # 构建完整的缩略图文件路径
-            config_path = self._config_path
-            thumbnail_path = config_path / "cache" / "thumbnails" / file_path
-            
-            logger.info(f"[CloudImg123] 请求缩略图: {file_path}")
-            logger.info(f"[CloudImg123] 构建路径: {thumbnail_path}")
-            logger.info(f"[CloudImg123] 配置路径: {config_path}")
-            
-            # 检查文件是否存在
-            if not thumbnail_path.exists():
-                logger.warning(f"[CloudImg123] 缩略图文件不存在: {thumbnail_path}")
-                # 检查cache目录是否存在
-                cache_dir = self._config_path / "cache" / "thumbnails"
-                if not cache_dir.exists():
-                    logger.warning(f"[CloudImg123] 缩略图缓存目录不存在: {cache_dir}")
-                else:
-                    # 列出目录内容
-                    try:
-                        files = list(cache_dir.glob("*.webp"))
-                        logger.info(f"[CloudImg123] 缓存目录中的文件: {[f.name for f in files[:5]]}")
-                    except Exception as list_e:
-                        logger.error(f"[CloudImg123] 列出缓存目录失败: {list_e}")
+            thumbnail_manager = self._history_manager.thumbnail_manager
+            wants_binary = raw or self._accepts_image(request)
+
+            # 选择变体并解析缓存目录中的文件（包含路径越界检查）
+            file_name = thumbnail_manager.select_variant(file_path, size, fmt, request.headers.get("accept", ""))
+            resolved = thumbnail_manager.resolve_cached_file(file_name)
+            parsed = thumbnail_manager.parse_file_name(file_path)
+            thumbnail_manager.record_access(parsed[0] if parsed else file_path, bool(resolved))
+            if not resolved:
+                logger.debug(f"[CloudImg123] 缩略图文件不存在: {file_path}")
+                if wants_binary:
+                    return Response(status_code=404)
                 return {"success": False, "message": "缩略图文件不存在"}
-            
-            # 检查文件大小
-            file_size = thumbnail_path.stat().st_size
-            logger.info(f"[CloudImg123] 缩略图文件大小: {file_size} bytes")
-            
-            if file_size == 0:
-                logger.error(f"[CloudImg123] 缩略图文件为空: {thumbnail_path}")
-                return {"success": False, "message": "缩略图文件为空"}
-            
-            # 检查文件是否在允许的目录内（安全检查）
-            try:
-                thumbnail_path.resolve().relative_to(self._config_path.resolve())
-            except ValueError:
-                logger.error(f"[CloudImg123] 非法的文件路径访问: {thumbnail_path}")
-                return {"success": False, "message": "非法的文件路径访问"}
-            
-            logger.info(f"[CloudImg123] 提供缩略图文件: {thumbnail_path}")
-            
-            # 尝试直接读取文件内容
-            try:
-                with open(thumbnail_path, 'rb') as f:
-                    file_content = f.read(1024)  # 读取前1KB验证文件
-                    logger.info(f"[CloudImg123] 文件前1024字节: {len(file_content)} bytes")
-                    if len(file_content) == 0:
-                        logger.error(f"[CloudImg123] 文件读取为空")
-            except Exception as read_error:
-                logger.error(f"[CloudImg123] 读取文件失败: {read_error}")
-            
-            # 读取文件内容并返回base64编码
-            try:
-                with open(thumbnail_path, 'rb') as f:
-                    file_content = f.read()
-                    
-                import base64
-                base64_content = base64.b64encode(file_content).decode('utf-8')
-                
-                logger.info(f"[CloudImg123] 缩略图读取成功，大小: {len(file_content)} bytes")
-                
-                return {
+
+            thumbnail_path, stat_result = resolved
+            mime_type = thumbnail_manager.get_mime_type(thumbnail_path)
+            etag = thumbnail_manager.make_etag(stat_result)
+            headers = {
+                "ETag": etag,
+                "Cache-Control": self.THUMBNAIL_CACHE_CONTROL,
+                "Vary": "Accept"
+            }
+
+            # 浏览器缓存仍有效
+            if self._etag_matches(request, etag):
+                return Response(status_code=304, headers=headers)
+
+            if wants_binary:
+                return FileResponse(thumbnail_path, media_type=mime_type, headers=headers, stat_result=stat_result)
+
+            # 兼容旧版前端：返回base64编码的JSON
+            with open(thumbnail_path, 'rb') as f:
+                file_content = f.read()
+
+            logger.debug(f"[CloudImg123] 提供缩略图: {file_path}，大小: {len(file_content)} bytes")
+
+            return JSONResponse(
+                content={
                     "success": True,
                     "message": "缩略图获取成功",
                     "data": {
-                        "content": base64_content,
-                        "mime_type": "image/webp",
+                        "content": base64.b64encode(file_content).decode('utf-8'),
+                        "mime_type": mime_type,
                         "size": len(file_content)
                     }
-                }
-                
-            except Exception as read_error:
-                logger.error(f"[CloudImg123] 读取缩略图文件失败: {read_error}")
-                return {"success": False, "message": f"读取文件失败: {str(read_error)}"}
+                },
+                headers=headers
+            )
             
         except Exception as e:
             logger.error(f"[CloudImg123] 提供缩略图文件异常: {str(e)}")
             return {"success": False, "message": f"服务器错误: {str(e)}"}
+
+    def get_thumbnails_batch(self, request: Request, file_ids: str = "", as_json: bool = False,
+                             size: int = None, fmt: str = None):
+        """
+        批量获取缩略图：一次请求返回多个file_id的缩略图
+
+        默认返回build_pack打包的二进制块（[4字节索引长度][索引JSON][数据区]），
+        as_json=true时返回base64 JSON；ETag由集合内容计算，支持If-None-Match返回304；
+        超出单次上限（200个）的file_id不返回内容，列入truncated；
+        size、fmt和Accept的含义与单个缩略图接口相同
+        """
+        try:
+            if not self._history_manager:
+                logger.error(f"[CloudImg123] 历史管理器未初始化")
+                return {"success": False, "message": "插件未正确初始化"}
+
+            ids = [file_id.strip() for file_id in file_ids.split(",") if file_id.strip()]
+            if not ids:
+                return {"success": False, "message": "缺少file_ids参数"}
+
+            thumbnail_manager = self._history_manager.thumbnail_manager
+            etag, payload = thumbnail_manager.build_pack(ids, size, fmt, request.headers.get("accept", ""))
+            headers = {
+                "ETag": etag,
+                "Cache-Control": self.THUMBNAIL_CACHE_CONTROL,
+                "Vary": "Accept"
+            }
+
+            if self._etag_matches(request, etag):
+                return Response(status_code=304, headers=headers)
+
+            if not as_json:
+                return Response(content=payload, media_type="application/octet-stream", headers=headers)
+
+            index, data = thumbnail_manager.unpack(payload)
+            items = {
+                item["file_id"]: {
+                    "content": base64.b64encode(data[item["offset"]:item["offset"] + item["size"]]).decode('utf-8'),
+                    "mime_type": item["mime_type"],
+                    "size": item["size"]
+                }
+                for item in index["items"]
+            }
+            return JSONResponse(
+                content={"success": True, "data": {"items": items, "missing": index["missing"],
+                                                    "truncated": index["truncated"]}},
+                headers=headers
+            )
+
+        except Exception as e:
+            logger.error(f"[CloudImg123] 批量获取缩略图异常: {str(e)}")
+            return {"success": False, "message": f"批量获取缩略图异常: {str(e)}"}
+
+    @staticmethod
+    def _accepts_image(request: Request) -> bool:
+        """
+        请求的Accept头是否偏好图片（浏览器<img>请求），而非JSON
+        """
+        accept = request.headers.get("accept", "").lower()
+        return "image/" in accept and "application/json" not in accept
+
+    @staticmethod
+    def _etag_matches(request: Request, etag: str) -> bool:
+        """
+        If-None-Match是否命中当前ETag
+        """
+        if_none_match = request.headers.get("if-none-match")
+        if not if_none_match:
+            return False
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in candidates or etag in candidates
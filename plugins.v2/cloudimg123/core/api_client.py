@@ -1,14 +1,20 @@
 import asyncio
 import hashlib
+import mmap
 import os
+import threading
 import time
-from typing import Optional, Dict, Any
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
 from pathlib import Path
 
 import aiohttp
-import requests
 from app.log import logger
+from .http_session import SharedSession
+from .rate_limit import HostRateLimiter
 from .token_manager import TokenManager
+from .upload_tracker import AsyncUploadTracker
+from .utils import normalize_file_id
 
 
 class CloudAPI123:
@@ -25,9 +31,15 @@ class CloudAPI123:
         # 初始化Token管理器
         self.token_manager = TokenManager(config_path)
         
-        # 内存中的token缓存（用于当前会话）
+        # 内存中的token缓存：过期时间和建议刷新时间（时间戳）
         self.access_token = None
         self.token_expires_at = 0
+        self.token_refresh_at = 0
+        # 后台刷新失败后的重试间隔（秒）
+        self.token_refresh_retry = 300
+        # 进行中的token刷新任务及其所属事件循环
+        self._token_task: Optional[asyncio.Task] = None
+        self._token_task_loop: Optional[asyncio.AbstractEventLoop] = None
         
         # API配置
         self.base_url = "https://open-api.123pan.com"
@@ -39,6 +51,53 @@ class CloudAPI123:
         # 文件类型（1表示文件）
         self.file_type = 1
 
+        # 分片上传配置：并发分片数、单分片最大尝试次数、重试间隔基数（秒）
+        self.slice_concurrency = 4
+        self.slice_max_retries = 3
+        self.slice_retry_delay = 1
+
+        # 按主机限速：默认每个主机每秒10个请求，允许20个突发
+        self.rate_limiter = HostRateLimiter(rate=10, burst=20)
+
+        # 共享HTTP会话（连接池 + keep-alive + DNS缓存 + 限速），首次请求时创建
+        self._http = SharedSession("CloudImg123-API", rate_limiter=self.rate_limiter)
+
+        # 文件详情缓存：fileID -> (过期时间, 下载链接/大小等)，按LRU淘汰
+        self.detail_cache_ttl = 1800
+        self.detail_cache_size = 1024
+        # 批量获取下载链接时的并发查询数
+        self.detail_concurrency = 8
+        self._detail_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._detail_lock = threading.Lock()
+
+        # 异步上传完成跟踪器：所有等待中的异步上传共用一个轮询调度任务
+        self._upload_tracker = AsyncUploadTracker(self._query_async_result)
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """
+        获取共享的HTTP会话
+        """
+        return await self._http.get()
+
+    async def aclose(self):
+        """
+        关闭共享HTTP会话（协程上下文）
+        """
+        await self._http.aclose()
+
+    def close(self):
+        """
+        关闭共享HTTP会话
+        """
+        self._upload_tracker.close()
+        self._http.close()
+
+    def set_rate_limit(self, rate: float, burst: int = None):
+        """
+        设置每个主机每秒最多发起的请求数（0表示不限速）
+        """
+        self.rate_limiter.configure(rate, burst or (int(rate * 2) if rate else None))
+
     def _log(self, level: str, message: str):
         """
         安全的日志记录方法
@@ -53,27 +112,73 @@ class CloudAPI123:
         elif level == "debug" and self.debug:
             logger.info(log_message)  # debug信息以info级别输出
 
-    async def get_access_token(self) -> Optional[str]:
+    async def get_access_token(self, background_refresh: bool = True) -> Optional[str]:
         """
-        获取访问令牌，优先使用存储的有效token
+        获取访问令牌，优先使用内存中的有效token
+
+        多个协程同时需要刷新时只发起一次刷新，其余协程等待同一结果；
+        token进入刷新窗口（到期前1天）后在后台刷新，调用方继续使用当前token，不等待刷新
+
+        :param background_refresh: 为False时在刷新窗口内等待刷新完成再返回，
+                                   用于随后即关闭的临时事件循环（后台任务会随循环关闭而丢失）
         """
         try:
-            # 1. 检查内存中的token是否还有效（用于当前会话）
-            if self.access_token and time.time() < self.token_expires_at:
+            # 1. 内存中的token未过期时直接使用
+            now = time.time()
+            if self.access_token and now < self.token_expires_at:
+                if now >= self.token_refresh_at:
+                    # 即将过期，后台刷新
+                    refresh = self._start_token_refresh(force=True)
+                    if not background_refresh:
+                        return await asyncio.shield(refresh)
                 logger.debug(f"[CloudImg123-API] 使用内存缓存的access_token")
                 return self.access_token
 
-            # 2. 尝试从存储中获取有效的token
-            stored_token = self.token_manager.get_stored_token()
-            if stored_token:
-                # 更新内存缓存
-                self.access_token = stored_token
-                # 设置内存缓存过期时间为1小时（避免频繁检查存储）
-                self.token_expires_at = time.time() + 3600
-                logger.info(f"[CloudImg123-API] 使用存储的有效access_token")
-                return stored_token
-
-            # 3. 如果没有有效的存储token，则从API获取新token
+            # 2. 没有可用token时等待刷新（同一时间只有一个刷新在进行）
+            return await asyncio.shield(self._start_token_refresh(force=False))
+
+        except Exception as e:
+            logger.error(f"[CloudImg123-API] 获取access_token异常: {str(e)}")
+            return None
+
+    def _start_token_refresh(self, force: bool) -> asyncio.Task:
+        """
+        启动token刷新任务，当前事件循环上已有进行中的刷新时直接复用
+        """
+        loop = asyncio.get_running_loop()
+        task = self._token_task
+        if task is not None and not task.done() and self._token_task_loop is loop:
+            return task
+
+        task = loop.create_task(self._refresh_token(force))
+        self._token_task = task
+        self._token_task_loop = loop
+        return task
+
+    def _set_memory_token(self, access_token: str, refresh_at: float, expires_at: float):
+        """
+        更新内存中的token及其刷新、过期时间
+        """
+        self.access_token = access_token
+        self.token_refresh_at = refresh_at
+        self.token_expires_at = expires_at
+
+    async def _refresh_token(self, force: bool = False) -> Optional[str]:
+        """
+        获取新token并更新存储和内存缓存
+
+        :param force: 为False时优先使用存储中未过期的token；为True时直接向API申请新token
+        """
+        try:
+            # 1. 尝试从存储中获取有效的token
+            if not force:
+                stored = self.token_manager.get_token_deadlines()
+                if stored:
+                    self._set_memory_token(*stored)
+                    logger.info(f"[CloudImg123-API] 使用存储的有效access_token")
+                    return stored[0]
+
+            # 2. 从API获取新token
             logger.info(f"[CloudImg123-API] 正在从API获取新的access_token...")
             
             url = f"{self.base_url}/api/v1/access_token"
@@ -86,43 +191,51 @@ class CloudAPI123:
                 'clientSecret': self.client_secret,
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(url, json=data, headers=headers) as response:
-                    if response.status != 200:
-                        logger.error(f"[CloudImg123-API] 获取token失败，HTTP状态码: {response.status}")
-                        return None
+            session = await self._get_session()
+            async with session.post(url, json=data, headers=headers) as response:
+                if response.status != 200:
+                    logger.error(f"[CloudImg123-API] 获取token失败，HTTP状态码: {response.status}")
+                    return self._refresh_failed()
                     
-                    resp_json = await response.json()
+                resp_json = await response.json()
                     
-                    if resp_json.get('code') != 0:
-                        logger.error(f"[CloudImg123-API] 获取token失败，错误码: {resp_json.get('code')}，消息: {resp_json.get('message')}")
-                        return None
+                if resp_json.get('code') != 0:
+                    logger.error(f"[CloudImg123-API] 获取token失败，错误码: {resp_json.get('code')}，消息: {resp_json.get('message')}")
+                    return self._refresh_failed()
                     
-                    token_data = resp_json.get('data', {})
-                    new_access_token = token_data.get('accessToken')
-                    expires_in = token_data.get('expiresIn', 2592000)  # 默认30天（秒）
+                token_data = resp_json.get('data', {})
+                new_access_token = token_data.get('accessToken')
+                expires_in = token_data.get('expiresIn', 2592000)  # 默认30天（秒）
                     
-                    if not new_access_token:
-                        logger.error(f"[CloudImg123-API] API返回的token数据无效")
-                        return None
+                if not new_access_token:
+                    logger.error(f"[CloudImg123-API] API返回的token数据无效")
+                    return self._refresh_failed()
                     
-                    # 4. 保存新token到存储
-                    save_success = self.token_manager.save_token(new_access_token, expires_in)
-                    if save_success:
-                        logger.info(f"[CloudImg123-API] 新token已保存到存储")
-                    else:
-                        logger.warning(f"[CloudImg123-API] 新token保存到存储失败，但仍可使用")
+                # 3. 保存新token到存储
+                save_success = self.token_manager.save_token(new_access_token, expires_in)
+                if save_success:
+                    logger.info(f"[CloudImg123-API] 新token已保存到存储")
+                else:
+                    logger.warning(f"[CloudImg123-API] 新token保存到存储失败，但仍可使用")
                     
-                    # 5. 更新内存缓存
-                    self.access_token = new_access_token
-                    self.token_expires_at = time.time() + 3600  # 内存缓存1小时
+                # 4. 更新内存缓存
+                self._set_memory_token(new_access_token, *self.token_manager.deadlines_for(time.time()))
                     
-                    logger.info(f"[CloudImg123-API] 获取新access_token成功")
-                    return new_access_token
+                logger.info(f"[CloudImg123-API] 获取新access_token成功")
+                return new_access_token
 
         except Exception as e:
             logger.error(f"[CloudImg123-API] 获取access_token异常: {str(e)}")
-            return None
+            return self._refresh_failed()
+
+    def _refresh_failed(self) -> Optional[str]:
+        """
+        刷新失败：当前token仍未过期时继续使用，并推迟下一次后台刷新
+        """
+        if self.access_token and time.time() < self.token_expires_at:
+            self.token_refresh_at = time.time() + self.token_refresh_retry
+            return self.access_token
+        return None
 
     def _calc_md5(self, filepath: str) -> str:
         """
@@ -140,9 +253,11 @@ class CloudAPI123:
         """
         return os.path.getsize(filepath)
 
-    async def upload_file(self, file_path: str, filename: str = None) -> Dict[str, Any]:
+    async def upload_file(self, file_path: str, filename: str = None, file_md5: str = None) -> Dict[str, Any]:
         """
         上传文件到123云盘
+
+        :param file_md5: 接收文件时已计算好的MD5，提供时不再重新读取文件计算
         """
         try:
             if not os.path.exists(file_path):
@@ -157,8 +272,12 @@ class CloudAPI123:
             if not filename:
                 filename = os.path.basename(file_path)
             
-            file_md5 = self._calc_md5(file_path)
             file_size = self._get_file_size(file_path)
+            if file_size == 0:
+                return {"success": False, "message": "文件为空"}
+
+            if not file_md5:
+                file_md5 = self._calc_md5(file_path)
             
             logger.info(f"[CloudImg123-API] 开始上传文件: {filename}，大小: {file_size} bytes")
 
@@ -177,133 +296,228 @@ class CloudAPI123:
                 'type': self.file_type,
             }
 
-            async with aiohttp.ClientSession() as session:
-                # 创建文件
-                async with session.post(f'{self.base_url}/upload/v1/oss/file/create', 
-                                      json=create_body, headers=headers) as response:
-                    if response.status != 200:
-                        return {"success": False, "message": f"创建文件失败，状态码: {response.status}"}
+            session = await self._get_session()
+            # 创建文件
+            async with session.post(f'{self.base_url}/upload/v1/oss/file/create', 
+                                  json=create_body, headers=headers) as response:
+                if response.status != 200:
+                    return {"success": False, "message": f"创建文件失败，状态码: {response.status}"}
                     
-                    resp_json = await response.json()
+                resp_json = await response.json()
                     
-                    if resp_json.get('code') != 0:
-                        return {"success": False, "message": f"创建文件失败: {resp_json.get('message')}"}
+                if resp_json.get('code') != 0:
+                    return {"success": False, "message": f"创建文件失败: {resp_json.get('message')}"}
 
-                    create_data = resp_json.get('data', {})
+                create_data = resp_json.get('data', {})
                     
-                    # 检查是否秒传成功
-                    if create_data.get('reuse'):
-                        file_id = create_data['fileID']
-                        logger.info(f"[CloudImg123-API] 文件秒传成功，fileID: {file_id}")
-                        return await self._get_download_url(file_id, filename)
+                # 检查是否秒传成功
+                if create_data.get('reuse'):
+                    file_id = create_data['fileID']
+                    logger.info(f"[CloudImg123-API] 文件秒传成功，fileID: {file_id}")
+                    return await self._get_download_url(file_id, filename)
 
-                    # 需要分片上传
-                    preupload_id = create_data.get('preuploadID')
-                    slice_size = create_data.get('sliceSize', 1024 * 1024 * 5)  # 默认5MB
-                    total_slice = (file_size + slice_size - 1) // slice_size
+                # 需要分片上传
+                preupload_id = create_data.get('preuploadID')
+                slice_size = create_data.get('sliceSize', 1024 * 1024 * 5)  # 默认5MB
+                total_slice = (file_size + slice_size - 1) // slice_size
                     
-                    logger.info(f"[CloudImg123-API] 需分片上传，共 {total_slice} 片，每片 {slice_size} 字节")
-
-                    # 步骤2&3：上传分片
-                    with open(file_path, 'rb') as f:
-                        for slice_no in range(1, total_slice + 1):
-                            chunk = f.read(slice_size)
-                            
-                            # 获取分片上传地址
-                            get_url_body = {
-                                'preuploadID': preupload_id,
-                                'sliceNo': slice_no,
-                            }
-                            
-                            async with session.post(f'{self.base_url}/upload/v1/oss/file/get_upload_url',
-                                                   json=get_url_body, headers=headers) as url_response:
-                                if url_response.status != 200:
-                                    return {"success": False, "message": f"获取上传地址失败，分片: {slice_no}"}
-                                
-                                url_json = await url_response.json()
-                                if url_json.get('code') != 0:
-                                    return {"success": False, "message": f"获取上传地址失败: {url_json.get('message')}"}
-                                
-                                presigned_url = url_json['data']['presignedURL']
-                                
-                                # 上传分片
-                                put_headers = {'Content-Type': 'application/octet-stream'}
-                                async with session.put(presigned_url, data=chunk, headers=put_headers) as put_response:
-                                    if put_response.status not in [200, 201]:
-                                        return {"success": False, "message": f"上传分片失败，分片: {slice_no}"}
-                                
-                                logger.debug(f"[CloudImg123-API] 分片 {slice_no}/{total_slice} 上传完成")
-
-                    # 步骤4：通知上传完成
-                    complete_body = {'preuploadID': preupload_id}
-                    async with session.post(f'{self.base_url}/upload/v1/oss/file/upload_complete',
-                                          json=complete_body, headers=headers) as complete_response:
-                        if complete_response.status != 200:
-                            return {"success": False, "message": "通知上传完成失败"}
+                logger.info(f"[CloudImg123-API] 需分片上传，共 {total_slice} 片，每片 {slice_size} 字节")
+
+                # 步骤2&3：并发上传分片，分片数据直接取自文件的内存映射窗口，不额外复制
+                with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    with memoryview(mapped) as view:
+                        slice_result = await self._upload_slices(session, view, preupload_id,
+                                                                 slice_size, total_slice, headers)
+                if not slice_result.get("success"):
+                    return slice_result
+
+                # 步骤4：通知上传完成
+                complete_body = {'preuploadID': preupload_id}
+                async with session.post(f'{self.base_url}/upload/v1/oss/file/upload_complete',
+                                      json=complete_body, headers=headers) as complete_response:
+                    if complete_response.status != 200:
+                        return {"success": False, "message": "通知上传完成失败"}
                         
-                        complete_json = await complete_response.json()
-                        if complete_json.get('code') != 0:
-                            return {"success": False, "message": f"通知上传完成失败: {complete_json.get('message')}"}
+                    complete_json = await complete_response.json()
+                    if complete_json.get('code') != 0:
+                        return {"success": False, "message": f"通知上传完成失败: {complete_json.get('message')}"}
                         
-                        complete_data = complete_json.get('data', {})
+                    complete_data = complete_json.get('data', {})
                         
-                        # 检查是否需要异步等待
-                        if not complete_data.get('async', False) and complete_data.get('fileID'):
-                            file_id = complete_data['fileID']
-                            logger.info(f"[CloudImg123-API] 同步上传完成，fileID: {file_id}")
-                            return await self._get_download_url(file_id, filename)
-                        else:
-                            # 异步上传，需要轮询结果
-                            logger.info(f"[CloudImg123-API] 异步上传，开始轮询...")
-                            return await self._wait_for_async_upload(preupload_id, filename, headers, session)
+                    # 检查是否需要异步等待
+                    if not complete_data.get('async', False) and complete_data.get('fileID'):
+                        file_id = complete_data['fileID']
+                        logger.info(f"[CloudImg123-API] 同步上传完成，fileID: {file_id}")
+                        return await self._get_download_url(file_id, filename)
+                    else:
+                        # 异步上传，需要轮询结果
+                        logger.info(f"[CloudImg123-API] 异步上传，开始轮询...")
+                        return await self._wait_for_async_upload(preupload_id, filename, headers, session)
 
         except Exception as e:
             logger.error(f"[CloudImg123-API] 上传文件异常: {str(e)}")
             return {"success": False, "message": f"上传异常: {str(e)}"}
 
+    def _slice_view(self, view: memoryview, slice_no: int, slice_size: int) -> memoryview:
+        """
+        获取指定分片的数据窗口（与文件映射共享内存，不复制数据）
+        """
+        start = (slice_no - 1) * slice_size
+        return view[start:start + slice_size]
+
+    async def _get_slice_upload_url(self, session: aiohttp.ClientSession, preupload_id: str,
+                                    slice_no: int, headers: dict) -> Dict[str, Any]:
+        """
+        获取分片的预签名上传地址
+        """
+        get_url_body = {
+            'preuploadID': preupload_id,
+            'sliceNo': slice_no,
+        }
+
+        async with session.post(f'{self.base_url}/upload/v1/oss/file/get_upload_url',
+                                json=get_url_body, headers=headers) as url_response:
+            if url_response.status != 200:
+                return {"success": False, "message": f"获取上传地址失败，分片: {slice_no}"}
+
+            url_json = await url_response.json()
+            if url_json.get('code') != 0:
+                return {"success": False, "message": f"获取上传地址失败: {url_json.get('message')}"}
+
+            return {"success": True, "presigned_url": url_json['data']['presignedURL']}
+
+    async def _upload_slice(self, session: aiohttp.ClientSession, view: memoryview, preupload_id: str,
+                            slice_no: int, slice_size: int, headers: dict) -> Dict[str, Any]:
+        """
+        上传单个分片，失败时按递增间隔重试
+        """
+        result = {"success": False, "message": f"上传分片失败，分片: {slice_no}"}
+
+        for attempt in range(1, self.slice_max_retries + 1):
+            try:
+                url_result = await self._get_slice_upload_url(session, preupload_id, slice_no, headers)
+                if url_result.get("success"):
+                    put_headers = {'Content-Type': 'application/octet-stream'}
+                    # 分片窗口用完即释放，否则内存映射无法关闭
+                    with self._slice_view(view, slice_no, slice_size) as chunk:
+                        async with session.put(url_result["presigned_url"], data=chunk,
+                                               headers=put_headers) as put_response:
+                            if put_response.status in [200, 201]:
+                                return {"success": True, "slice_no": slice_no}
+                    result = {"success": False, "message": f"上传分片失败，分片: {slice_no}，状态码: {put_response.status}"}
+                else:
+                    result = url_result
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                result = {"success": False, "message": f"上传分片异常，分片: {slice_no}，{str(e)}"}
+
+            if attempt < self.slice_max_retries:
+                logger.warning(f"[CloudImg123-API] {result['message']}，第 {attempt} 次重试")
+                await asyncio.sleep(self.slice_retry_delay * attempt)
+
+        return result
+
+    async def _upload_slices(self, session: aiohttp.ClientSession, view: memoryview, preupload_id: str,
+                             slice_size: int, total_slice: int, headers: dict) -> Dict[str, Any]:
+        """
+        并发上传全部分片
+
+        最多同时有slice_concurrency个分片在获取上传地址或上传中；任一分片重试耗尽后取消其余分片，
+        所有分片都确认完成后才返回成功
+        """
+        semaphore = asyncio.Semaphore(self.slice_concurrency)
+        completed = [False] * total_slice
+
+        async def upload_one(slice_no: int) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._upload_slice(session, view, preupload_id,
+                                                slice_no, slice_size, headers)
+
+        tasks = [asyncio.ensure_future(upload_one(slice_no)) for slice_no in range(1, total_slice + 1)]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                result = await finished
+                if not result.get("success"):
+                    return result
+
+                completed[result["slice_no"] - 1] = True
+                logger.debug(f"[CloudImg123-API] 分片 {result['slice_no']}/{total_slice} 上传完成，"
+                             f"已完成 {sum(completed)}/{total_slice}")
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+        missing = [index + 1 for index, done in enumerate(completed) if not done]
+        if missing:
+            return {"success": False, "message": f"分片未全部完成: {missing}"}
+
+        return {"success": True}
+
     async def _wait_for_async_upload(self, preupload_id: str, filename: str, 
                                    headers: dict, session: aiohttp.ClientSession) -> Dict[str, Any]:
         """
         等待异步上传完成
+
+        由共享的上传跟踪器统一轮询（指数退避+随机抖动），多个上传同时等待时只有一个调度任务在查询
         """
         try:
-            max_wait_time = 300  # 最大等待5分钟
-            wait_interval = 2    # 每2秒查询一次
-            waited = 0
-            
-            while waited < max_wait_time:
-                async_body = {'preuploadID': preupload_id}
-                async with session.post(f'{self.base_url}/upload/v1/oss/file/upload_async_result',
-                                      json=async_body, headers=headers) as async_response:
-                    if async_response.status != 200:
-                        return {"success": False, "message": "查询异步上传结果失败"}
-                    
-                    async_json = await async_response.json()
-                    if async_json.get('code') != 0:
-                        return {"success": False, "message": f"查询异步上传结果失败: {async_json.get('message')}"}
-                    
-                    async_data = async_json.get('data', {})
-                    if async_data.get('completed') and async_data.get('fileID'):
-                        file_id = async_data['fileID']
-                        logger.info(f"[CloudImg123-API] 异步上传完成，fileID: {file_id}")
-                        return await self._get_download_url(file_id, filename)
-                    
-                    # 等待一段时间后重试
-                    await asyncio.sleep(wait_interval)
-                    waited += wait_interval
-                    logger.debug(f"[CloudImg123-API] 异步上传等待中，已等待 {waited} 秒")
-            
-            return {"success": False, "message": "异步上传超时"}
+            result = await self._upload_tracker.wait(preupload_id)
+            if not result.get("success"):
+                return result
+
+            file_id = result["file_id"]
+            logger.info(f"[CloudImg123-API] 异步上传完成，fileID: {file_id}")
+            return await self._get_download_url(file_id, filename)
             
         except Exception as e:
             logger.error(f"[CloudImg123-API] 等待异步上传异常: {str(e)}")
             return {"success": False, "message": f"异步上传异常: {str(e)}"}
 
-    async def _get_download_url(self, file_id: str, filename: str) -> Dict[str, Any]:
+    async def _query_async_result(self, preupload_id: str) -> Dict[str, Any]:
+        """
+        查询一次异步上传结果（供上传跟踪器调用）
+
+        返回{"completed": bool, "file_id": str}；接口明确返回错误码时返回失败结果；
+        网络错误或非200状态码抛出异常，由跟踪器按退避重试
+        """
+        token = await self.get_access_token()
+        if not token:
+            raise RuntimeError("无法获取访问令牌")
+
+        headers = {
+            'Authorization': f'Bearer {token}',
+            'Platform': self.platform,
+            'Content-Type': 'application/json',
+        }
+        session = await self._get_session()
+        async with session.post(f'{self.base_url}/upload/v1/oss/file/upload_async_result',
+                                json={'preuploadID': preupload_id}, headers=headers) as async_response:
+            if async_response.status != 200:
+                raise RuntimeError(f"查询异步上传结果失败，状态码: {async_response.status}")
+
+            async_json = await async_response.json()
+            if async_json.get('code') != 0:
+                return {"success": False, "message": f"查询异步上传结果失败: {async_json.get('message')}"}
+
+            async_data = async_json.get('data', {})
+            return {"completed": bool(async_data.get('completed')), "file_id": async_data.get('fileID')}
+
+    async def _get_download_url(self, file_id: str, filename: str, refresh: bool = False) -> Dict[str, Any]:
         """
         获取文件下载链接
+
+        :param refresh: 为True时忽略缓存，重新查询文件详情
         """
         try:
+            cached = None if refresh else self._get_cached_detail(file_id)
+            if cached is not None:
+                logger.debug(f"[CloudImg123-API] 命中文件详情缓存: {file_id}")
+                return {"success": True, "file_id": file_id, "filename": filename, **cached}
+
             token = await self.get_access_token()
             if not token:
                 return {"success": False, "message": "无法获取访问令牌"}
@@ -315,38 +529,100 @@ class CloudAPI123:
             
             params = {'fileID': file_id}
             
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f'{self.base_url}/api/v1/oss/file/detail',
-                                     params=params, headers=headers) as response:
-                    if response.status != 200:
-                        return {"success": False, "message": f"获取文件详情失败，状态码: {response.status}"}
+            session = await self._get_session()
+            async with session.get(f'{self.base_url}/api/v1/oss/file/detail',
+                                 params=params, headers=headers) as response:
+                if response.status != 200:
+                    return {"success": False, "message": f"获取文件详情失败，状态码: {response.status}"}
                     
-                    detail_json = await response.json()
-                    if detail_json.get('code') != 0:
-                        return {"success": False, "message": f"获取文件详情失败: {detail_json.get('message')}"}
+                detail_json = await response.json()
+                if detail_json.get('code') != 0:
+                    return {"success": False, "message": f"获取文件详情失败: {detail_json.get('message')}"}
                     
-                    detail_data = detail_json.get('data', {})
-                    download_url = detail_data.get('downloadURL')
+                detail_data = detail_json.get('data', {})
+                download_url = detail_data.get('downloadURL')
                     
-                    if not download_url:
-                        return {"success": False, "message": "未获取到下载链接"}
+                if not download_url:
+                    return {"success": False, "message": "未获取到下载链接"}
                     
-                    logger.info(f"[CloudImg123-API] 获取下载链接成功: {download_url}")
+                logger.info(f"[CloudImg123-API] 获取下载链接成功: {download_url}")
+
+                detail = {
+                    "download_url": download_url,
+                    "user_self_url": detail_data.get('userSelfURL'),
+                    "size": detail_data.get('size'),
+                    "upload_time": detail_data.get('createTime')
+                }
+                self._cache_detail(file_id, detail)
                     
-                    return {
-                        "success": True,
-                        "file_id": file_id,
-                        "filename": filename,
-                        "download_url": download_url,
-                        "user_self_url": detail_data.get('userSelfURL'),
-                        "size": detail_data.get('size'),
-                        "upload_time": detail_data.get('createTime')
-                    }
+                return {"success": True, "file_id": file_id, "filename": filename, **detail}
 
         except Exception as e:
             logger.error(f"[CloudImg123-API] 获取下载链接异常: {str(e)}")
             return {"success": False, "message": f"获取下载链接异常: {str(e)}"}
 
+    def _get_cached_detail(self, file_id: str) -> Optional[Dict[str, Any]]:
+        """
+        读取未过期的文件详情缓存，命中时移至LRU末尾
+        """
+        file_id = normalize_file_id(file_id)
+        with self._detail_lock:
+            entry = self._detail_cache.get(file_id)
+            if entry is None:
+                return None
+            expires_at, detail = entry
+            if expires_at <= time.monotonic():
+                del self._detail_cache[file_id]
+                return None
+            self._detail_cache.move_to_end(file_id)
+            return dict(detail)
+
+    def _cache_detail(self, file_id: str, detail: Dict[str, Any]):
+        """
+        写入文件详情缓存，超出容量时淘汰最久未使用的条目
+
+        缓存以字符串file_id为键：上传流程得到的是数字fileID，重新获取链接时使用历史记录中的字符串
+        """
+        file_id = normalize_file_id(file_id)
+        if not file_id or self.detail_cache_size <= 0:
+            return
+        with self._detail_lock:
+            self._detail_cache[file_id] = (time.monotonic() + self.detail_cache_ttl, dict(detail))
+            self._detail_cache.move_to_end(file_id)
+            while len(self._detail_cache) > self.detail_cache_size:
+                self._detail_cache.popitem(last=False)
+
+    def invalidate_detail(self, file_id: str = None):
+        """
+        使文件详情缓存失效，file_id为空时清空全部
+        """
+        with self._detail_lock:
+            if file_id is None:
+                self._detail_cache.clear()
+            else:
+                self._detail_cache.pop(normalize_file_id(file_id), None)
+
+    async def resolve_download_urls(self, file_ids: List[str], concurrency: int = None,
+                                    refresh: bool = False) -> Dict[str, Dict[str, Any]]:
+        """
+        批量获取文件下载链接，缓存未命中的文件以有限并发查询详情
+
+        :param concurrency: 同时查询的文件数，缺省为detail_concurrency
+        :param refresh: 为True时忽略缓存
+        :return: file_id -> _get_download_url的结果
+        """
+        unique_ids = list(dict.fromkeys(file_id for file_id in file_ids if file_id))
+        semaphore = asyncio.Semaphore(max(int(concurrency or self.detail_concurrency), 1))
+
+        async def resolve_one(file_id: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self._get_download_url(file_id, "", refresh=refresh)
+
+        results = await asyncio.gather(*(resolve_one(file_id) for file_id in unique_ids))
+        resolved = sum(1 for result in results if result.get("success"))
+        logger.info(f"[CloudImg123-API] 批量获取下载链接完成: {resolved}/{len(unique_ids)}")
+        return dict(zip(unique_ids, results))
+
     def test_connection(self) -> bool:
         """
         测试API连接
@@ -355,8 +631,13 @@ class CloudAPI123:
             # 使用同步方式测试连接
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
-            token = loop.run_until_complete(self.get_access_token())
-            loop.close()
+            try:
+                # 临时循环随后即关闭，刷新需在循环内完成
+                token = loop.run_until_complete(self.get_access_token(background_refresh=False))
+            finally:
+                # 会话绑定在临时事件循环上，需在循环关闭前释放
+                loop.run_until_complete(self.aclose())
+                loop.close()
             return token is not None
         except Exception as e:
             logger.error(f"[CloudImg123-API] 测试连接异常: {str(e)}")
@@ -372,8 +653,7 @@ class CloudAPI123:
             
             if save_success:
                 # 同时更新内存缓存
-                self.access_token = access_token
-                self.token_expires_at = time.time() + 3600  # 内存缓存1小时
+                self._set_memory_token(access_token, *self.token_manager.deadlines_for(time.time()))
                 logger.info(f"[CloudImg123-API] 手动token设置成功")
                 return True
             else:
@@ -408,8 +688,7 @@ class CloudAPI123:
             clear_success = self.token_manager.clear_token()
             
             # 清除内存缓存
-            self.access_token = None
-            self.token_expires_at = 0
+            self._set_memory_token(None, 0, 0)
             
             if clear_success:
                 logger.info(f"[CloudImg123-API] token已清除")
@@ -1,10 +1,18 @@
-import json
+import asyncio
+import base64
+import threading
 import uuid
-from datetime import datetime
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from datetime import date, datetime, timedelta
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Set, Tuple
 
 from app.log import logger
+from .history_store import HistoryStore
+from .link_formats import LinkFormatter, default_formatter
+from .utils import normalize_file_id
 
 
 class UploadRecord:
@@ -14,62 +22,80 @@ class UploadRecord:
     
     def __init__(self, record_id: str = None, filename: str = "", file_id: str = "",
                  download_url: str = "", user_self_url: str = "", file_size: int = 0,
-                 upload_time: str = None, formats: Dict[str, str] = None, 
-                 file_hash: str = None):
+                 upload_time: str = None, file_hash: str = None, etag: str = None):
         self.id = record_id or str(uuid.uuid4())
         self.filename = filename
-        self.file_id = file_id
+        self.file_id = normalize_file_id(file_id)
         self.download_url = download_url
         self.user_self_url = user_self_url or download_url
         self.file_size = file_size
         self.upload_time = upload_time or datetime.now().isoformat()
-        self.formats = formats or {}
         self.file_hash = file_hash  # 新增：文件哈希值
+        self.etag = etag  # 文件MD5（123云盘etag）
 
-    def to_dict(self) -> Dict[str, Any]:
+    def get_formats(self, formatter: LinkFormatter = None) -> Dict[str, str]:
         """
-        转换为字典格式，兼容前端期望的字段名
+        按链接模板即时生成各种格式的链接
+        """
+        return (formatter or default_formatter).render(self.download_url, self.filename, self.file_id, self.file_size)
+
+    def to_storage_dict(self) -> Dict[str, Any]:
+        """
+        转换为存储用的字典，只包含规范字段
         """
         return {
             "id": self.id,
             "filename": self.filename,
-            "original_name": self.filename,  # 前端期望的字段名
             "file_id": self.file_id,
-            "file_hash": self.file_hash,  # 新增字段
+            "file_hash": self.file_hash,
+            "etag": self.etag,
             "download_url": self.download_url,
-            "thumbnail_url": self.download_url,  # 123云盘没有缩略图，使用原图
             "user_self_url": self.user_self_url,
             "file_size": self.file_size,
-            "upload_time": self.upload_time,
-            "formats": self.formats
+            "upload_time": self.upload_time
         }
-    
-    def to_dict_with_thumbnail(self, thumbnail_manager) -> Dict[str, Any]:
+
+    def to_dict(self, formatter: LinkFormatter = None, with_formats: bool = True) -> Dict[str, Any]:
         """
-        转换为字典格式，包含缩略图路径
+        转换为字典格式，兼容前端期望的字段名
+
+        :param formatter: 链接格式生成器，为空时使用内置模板
+        :param with_formats: 是否生成formats字段
         """
-        # 获取缩略图URL路径
-        thumbnail_url_path = thumbnail_manager.get_thumbnail_url_path(self.file_id)
-        
-        return {
+        result = {
             "id": self.id,
             "filename": self.filename,
-            "original_name": self.filename,
+            "original_name": self.filename,  # 前端期望的字段名
             "file_id": self.file_id,
             "file_hash": self.file_hash,  # 新增字段
+            "etag": self.etag,
             "download_url": self.download_url,
-            "thumbnail_url": thumbnail_url_path or self.download_url,  # 优先使用本地缩略图
+            "thumbnail_url": self.download_url,  # 123云盘没有缩略图，使用原图
             "user_self_url": self.user_self_url,
             "file_size": self.file_size,
-            "upload_time": self.upload_time,
-            "formats": self.formats,
-            "has_local_thumbnail": bool(thumbnail_url_path)  # 标记是否有本地缩略图
+            "upload_time": self.upload_time
         }
+        if with_formats:
+            result["formats"] = self.get_formats(formatter)
+        return result
+    
+    def to_dict_with_thumbnail(self, thumbnail_manager, formatter: LinkFormatter = None,
+                               with_formats: bool = True) -> Dict[str, Any]:
+        """
+        转换为字典格式，包含缩略图路径
+        """
+        # 获取缩略图URL路径
+        thumbnail_url_path = thumbnail_manager.get_thumbnail_url_path(self.file_id)
+        
+        result = self.to_dict(formatter, with_formats)
+        result["thumbnail_url"] = thumbnail_url_path or self.download_url  # 优先使用本地缩略图
+        result["has_local_thumbnail"] = bool(thumbnail_url_path)  # 标记是否有本地缩略图
+        return result
 
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'UploadRecord':
         """
-        从字典创建记录对象
+        从字典创建记录对象（旧数据中的formats字段会被忽略，链接格式改为按需生成）
         """
         return cls(
             record_id=data.get("id"),
@@ -79,30 +105,69 @@ class UploadRecord:
             user_self_url=data.get("user_self_url", ""),
             file_size=data.get("file_size", 0),
             upload_time=data.get("upload_time"),
-            formats=data.get("formats", {}),
-            file_hash=data.get("file_hash")  # 新增字段
+            file_hash=data.get("file_hash"),  # 新增字段
+            etag=data.get("etag")
         )
 
 
 class HistoryManager:
     """
-    历史记录管理器，使用config/plugins/cloudimg123目录存储
+    历史记录管理器，使用config/plugins/cloudimg123目录下的SQLite数据库存储
+
+    全部记录常驻内存并维护file_id/哈希索引，读操作不访问磁盘；
+    写操作先修改内存，再在flush_delay秒的窗口内合并为一次事务落盘
     """
     
-    def __init__(self, config_path: Path, limit: int = 50):
+    def __init__(self, config_path: Path, limit: int = 50, flush_delay: float = 2.0,
+                 thumbnail_concurrency: int = 4, link_templates: Dict[str, str] = None):
         self.config_path = config_path
         self.limit = limit
         self.history_file = config_path / "upload_history.json"
+        self.db_file = config_path / "upload_history.db"
+        # 写入合并窗口（秒）：窗口内的多次修改合并为一次落盘
+        self.flush_delay = flush_delay
+        # 链接格式生成器（内置模板+用户自定义模板）
+        self.link_formatter = LinkFormatter(link_templates)
         
         # 导入缩略图管理器
         from .thumbnail_manager import ThumbnailManager
-        self.thumbnail_manager = ThumbnailManager(config_path)
+        self.thumbnail_manager = ThumbnailManager(config_path, concurrency=thumbnail_concurrency)
         
         # 确保配置目录存在
         if not self.config_path.exists():
             self.config_path.mkdir(parents=True, exist_ok=True)
             logger.info(f"[CloudImg123-History] 创建历史数据目录: {self.config_path}")
 
+        # 历史记录存储（首次启动时自动迁移旧版JSON文件）
+        self.store = HistoryStore(self.db_file, legacy_json=self.history_file)
+
+        # 常驻内存的记录：按从旧到新排列，末尾为最新记录
+        self._lock = threading.RLock()
+        # 串行化落盘，保证快照按取出的顺序写入存储（先于_lock获取）
+        self._flush_lock = threading.Lock()
+        self._records: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._seq: Dict[str, int] = {}
+        self._max_seq = 0
+        # 按升序排列的记录序号及序号到记录ID的映射，用于游标分页时直接定位
+        self._order: List[int] = []
+        self._by_seq: Dict[int, str] = {}
+        self._by_file_id: Dict[str, str] = {}
+        # 内容哈希索引：前端file_hash与123云盘etag（MD5）都指向对应记录，用于秒级去重
+        self._by_content: Dict[str, str] = {}
+
+        # 统计聚合：随增删增量维护，每条记录的日期只解析一次
+        self._total_size = 0
+        self._daily_count: Counter = Counter()
+        self._daily_size: Counter = Counter()
+        self._record_day: Dict[str, Optional[date]] = {}
+
+        # 待落盘的变更
+        self._dirty: Set[str] = set()
+        self._deleted: Set[str] = set()
+        self._flush_timer: Optional[threading.Timer] = None
+
+        self._load_records()
+
     def _log(self, level: str, message: str):
         """
         安全的日志记录方法
@@ -115,58 +180,252 @@ class HistoryManager:
         elif level == "warning":
             logger.warning(log_message)
 
-    def _load_history(self) -> List[Dict[str, Any]]:
+    def close(self):
         """
-        从文件加载历史记录
+        立即落盘未保存的变更并关闭历史记录存储
         """
         try:
-            if not self.history_file.exists():
-                return []
-            
-            with open(self.history_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data if isinstance(data, list) else []
-                
+            self.thumbnail_manager.close()
+            self.flush()
+            self.store.close()
         except Exception as e:
-            logger.error(f"[CloudImg123-History] 加载历史记录失败: {str(e)}")
-            return []
+            logger.error(f"[CloudImg123-History] 关闭历史记录存储异常: {str(e)}")
 
-    def _save_history(self, history: List[Dict[str, Any]]) -> bool:
+    def _load_records(self):
         """
-        保存历史记录到文件
+        启动时从存储加载全部记录到内存
         """
         try:
-            with open(self.history_file, 'w', encoding='utf-8') as f:
-                json.dump(history, f, ensure_ascii=False, indent=2)
-            return True
-            
+            for seq, record_data in self.store.load_all():
+                record = UploadRecord.from_dict(record_data).to_storage_dict()
+                self._records[record["id"]] = record
+                self._seq[record["id"]] = seq
+                self._order.append(seq)
+                self._by_seq[seq] = record["id"]
+                self._index(record)
+                self._account(record)
+                self._max_seq = max(self._max_seq, seq)
+
+            logger.info(f"[CloudImg123-History] 已加载历史记录 {len(self._records)} 条")
+
         except Exception as e:
-            logger.error(f"[CloudImg123-History] 保存历史记录失败: {str(e)}")
-            return False
+            logger.error(f"[CloudImg123-History] 加载历史记录失败: {str(e)}")
+
+    @staticmethod
+    def _content_keys(record: Dict[str, Any]) -> Set[str]:
+        """
+        记录的内容哈希键（file_hash与etag，统一小写）
+        """
+        return {value.lower() for value in (record.get("file_hash"), record.get("etag")) if value}
+
+    def _index(self, record: Dict[str, Any]):
+        """
+        将记录加入file_id和内容哈希索引
+        """
+        if record.get("file_id"):
+            self._by_file_id[normalize_file_id(record["file_id"])] = record["id"]
+        for key in self._content_keys(record):
+            self._by_content[key] = record["id"]
+
+    def _unindex(self, record: Dict[str, Any]):
+        """
+        将记录移出file_id和内容哈希索引
+        """
+        file_id = normalize_file_id(record.get("file_id"))
+        if self._by_file_id.get(file_id) == record["id"]:
+            del self._by_file_id[file_id]
+        for key in self._content_keys(record):
+            if self._by_content.get(key) == record["id"]:
+                del self._by_content[key]
+
+    def _put_front(self, record: Dict[str, Any]):
+        """
+        将记录放到最前面（调用方需持有锁）
+        """
+        record_id = record["id"]
+        if record_id in self._records:
+            self._unaccount(self._records[record_id])
+            self._discard_seq(self._seq[record_id])
+        self._records[record_id] = record
+        self._records.move_to_end(record_id)
+        self._max_seq += 1
+        self._seq[record_id] = self._max_seq
+        self._order.append(self._max_seq)
+        self._by_seq[self._max_seq] = record_id
+        self._index(record)
+        self._account(record)
+        self._dirty.add(record_id)
+        self._deleted.discard(record_id)
+
+    def _remove(self, record_id: str) -> Optional[Dict[str, Any]]:
+        """
+        从内存中移除记录（调用方需持有锁）
+        """
+        record = self._records.pop(record_id, None)
+        if record is None:
+            return None
+        self._discard_seq(self._seq.pop(record_id, None))
+        self._unindex(record)
+        self._unaccount(record)
+        self._dirty.discard(record_id)
+        self._deleted.add(record_id)
+        return record
+
+    def _discard_seq(self, seq: Optional[int]):
+        """
+        从有序序号列表中移除序号（调用方需持有锁）
+        """
+        if seq is None:
+            return
+        index = bisect_left(self._order, seq)
+        if index < len(self._order) and self._order[index] == seq:
+            del self._order[index]
+        self._by_seq.pop(seq, None)
+
+    @staticmethod
+    def _day_key(upload_time: Any) -> Optional[date]:
+        """
+        解析上传时间所属的日期，无法解析时返回None
+        """
+        if not upload_time or not isinstance(upload_time, str):
+            return None
+        try:
+            return datetime.fromisoformat(upload_time.replace('Z', '+00:00')).date()
+        except ValueError:
+            return None
+
+    def _account(self, record: Dict[str, Any]):
+        """
+        将记录计入统计聚合（调用方需持有锁）
+        """
+        record_id = record["id"]
+        size = record.get("file_size", 0) or 0
+        day = self._day_key(record.get("upload_time"))
+
+        self._total_size += size
+        self._record_day[record_id] = day
+        if day is not None:
+            self._daily_count[day] += 1
+            self._daily_size[day] += size
+
+    def _unaccount(self, record: Dict[str, Any]):
+        """
+        将记录移出统计聚合（调用方需持有锁）
+        """
+        record_id = record["id"]
+        if record_id not in self._record_day:
+            return
+        size = record.get("file_size", 0) or 0
+        day = self._record_day.pop(record_id)
+
+        self._total_size -= size
+        if day is not None:
+            self._daily_count[day] -= 1
+            self._daily_size[day] -= size
+            if self._daily_count[day] <= 0:
+                del self._daily_count[day]
+                del self._daily_size[day]
+
+    def _sum_days(self, start: date, end: date) -> Tuple[int, int]:
+        """
+        统计[start, end]日期范围内的上传数量和大小（调用方需持有锁）
+
+        范围跨度小于有记录的天数时逐日累加，否则遍历有记录的日期，耗时不超过两者中的较小值
+        """
+        if start > end:
+            return 0, 0
+        if (end - start).days + 1 <= len(self._daily_count):
+            days = (start + timedelta(days=offset) for offset in range((end - start).days + 1))
+        else:
+            days = (day for day in self._daily_count if start <= day <= end)
+
+        count = size = 0
+        for day in days:
+            count += self._daily_count.get(day, 0)
+            size += self._daily_size.get(day, 0)
+        return count, size
+
+    def _trim(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        仅保留最新的limit条记录，返回被移除的记录（调用方需持有锁）
+        """
+        removed = []
+        if limit and limit > 0:
+            while len(self._records) > limit:
+                oldest_id = next(iter(self._records))
+                removed.append(self._remove(oldest_id))
+        return removed
+
+    def _schedule_flush(self):
+        """
+        安排一次延迟落盘，窗口内的多次修改只写一次
+        """
+        with self._lock:
+            if self._flush_timer is not None:
+                return
+            self._flush_timer = threading.Timer(self.flush_delay, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self) -> bool:
+        """
+        将内存中的变更写入存储（单个事务，整体成功或整体回滚）
+
+        只在锁内取出变更快照，写盘时不持有_lock，读写请求无需等待磁盘I/O；
+        写入失败时将快照中的记录重新标记为待写入，由后续落盘重试
+        """
+        with self._flush_lock:
+            with self._lock:
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+
+                if not self._dirty and not self._deleted:
+                    return True
+
+                dirty, deleted = self._dirty, self._deleted
+                self._dirty, self._deleted = set(), set()
+                upserts = [(dict(self._records[record_id]), self._seq[record_id]) for record_id in dirty]
+
+            try:
+                self.store.apply_changes(upserts, list(deleted))
+                return True
+
+            except Exception as e:
+                logger.error(f"[CloudImg123-History] 保存历史记录失败: {str(e)}")
+                with self._lock:
+                    # 快照之后又被删除或重新写入的记录以新的状态为准
+                    self._dirty.update(record_id for record_id in dirty
+                                       if record_id in self._records and record_id not in self._deleted)
+                    self._deleted.update(record_id for record_id in deleted if record_id not in self._dirty)
+                return False
+
+    def _load_history(self, limit: int = 0) -> List[Dict[str, Any]]:
+        """
+        按从新到旧的顺序返回内存中的记录副本（limit为0表示全部）
+        """
+        with self._lock:
+            records = reversed(self._records.values())
+            if limit and limit > 0:
+                records = islice(records, limit)
+            return [dict(record) for record in records]
 
     def add_record(self, record: UploadRecord) -> bool:
         """
         添加上传记录
         """
         try:
-            history = self._load_history()
-            
-            # 添加新记录到开头
-            history.insert(0, record.to_dict())
-            
-            # 限制历史记录数量（limit为0表示无限）
-            if self.limit > 0 and len(history) > self.limit:
-                history = history[:self.limit]
-                logger.info(f"[CloudImg123-History] 历史记录超出限制，保留最新 {self.limit} 条")
-            
-            # 保存到文件
-            success = self._save_history(history)
-            if success:
-                logger.info(f"[CloudImg123-History] 添加历史记录成功: {record.filename}")
-            else:
-                logger.error(f"[CloudImg123-History] 添加历史记录失败: {record.filename}")
+            with self._lock:
+                # 添加新记录到开头
+                self._put_front(record.to_storage_dict())
                 
-            return success
+                # 限制历史记录数量（limit为0表示无限）
+                if self._trim(self.limit):
+                    logger.info(f"[CloudImg123-History] 历史记录超出限制，保留最新 {self.limit} 条")
+            
+            self._schedule_flush()
+            logger.info(f"[CloudImg123-History] 添加历史记录成功: {record.filename}")
+            return True
             
         except Exception as e:
             logger.error(f"[CloudImg123-History] 添加历史记录异常: {str(e)}")
@@ -177,12 +436,12 @@ class HistoryManager:
         获取历史记录列表
         """
         try:
-            history = self._load_history()
-            
             # 应用查询限制（limit为0表示无限）
             query_limit = limit or self.limit
-            if query_limit > 0 and len(history) > query_limit:
-                history = history[:query_limit]
+            history = [
+                UploadRecord.from_dict(record_data).to_dict(self.link_formatter)
+                for record_data in self._load_history(query_limit)
+            ]
             
             logger.info(f"[CloudImg123-History] 获取历史记录 {len(history)} 条")
             return history
@@ -196,18 +455,14 @@ class HistoryManager:
         获取历史记录列表，包含缩略图信息
         """
         try:
-            history = self._load_history()
-            
             # 应用查询限制（limit为0表示无限）
             query_limit = limit or self.limit
-            if query_limit > 0 and len(history) > query_limit:
-                history = history[:query_limit]
             
             # 转换为记录对象并添加缩略图信息
             result = []
-            for record_data in history:
+            for record_data in self._load_history(query_limit):
                 record = UploadRecord.from_dict(record_data)
-                result.append(record.to_dict_with_thumbnail(self.thumbnail_manager))
+                result.append(record.to_dict_with_thumbnail(self.thumbnail_manager, self.link_formatter))
             
             logger.info(f"[CloudImg123-History] 获取历史记录（含缩略图）{len(result)} 条")
             return result
@@ -216,18 +471,103 @@ class HistoryManager:
             logger.error(f"[CloudImg123-History] 获取历史记录（含缩略图）异常: {str(e)}")
             return []
 
+    @staticmethod
+    def encode_cursor(seq: int) -> str:
+        """
+        将记录序号编码为不透明的分页游标
+        """
+        return base64.urlsafe_b64encode(f"seq:{seq}".encode()).decode().rstrip("=")
+
+    @staticmethod
+    def decode_cursor(cursor: str) -> int:
+        """
+        解析分页游标，格式错误时抛出ValueError
+        """
+        try:
+            raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+            prefix, seq = raw.split(":", 1)
+            if prefix != "seq":
+                raise ValueError(raw)
+            return int(seq)
+        except Exception:
+            raise ValueError("无效的分页游标")
+
+    def query_history(self, cursor: str = None, limit: int = 0, fields: List[str] = None,
+                      filename: str = None, start: date = None, end: date = None,
+                      file_id: str = None, with_thumbnails: bool = True) -> Dict[str, Any]:
+        """
+        按从新到旧的顺序分页查询历史记录
+
+        以记录序号为键做游标分页：游标记录上一页最后一条的序号，下一页从比它更早的记录继续，
+        翻页期间的新增、删除和置顶不会导致重复或遗漏（置顶的记录会出现在第一页）
+
+        :param cursor: 上一页返回的next_cursor，为空时从最新记录开始，格式错误时抛出ValueError
+        :param limit: 每页条数，0表示不分页
+        :param fields: 只返回这些字段（id总会返回），为空时返回全部字段
+        :param filename: 文件名包含该字符串（不区分大小写）
+        :param start: 上传日期不早于该日期
+        :param end: 上传日期不晚于该日期
+        :param file_id: 只返回该file_id对应的记录
+        :param with_thumbnails: 是否附带本地缩略图信息
+        :return: {"items": 记录列表, "next_cursor": 下一页游标或None, "has_more": 是否还有更多}
+        """
+        before = self.decode_cursor(cursor) if cursor else None
+        keyword = filename.lower() if filename else None
+        page_size = limit if limit and limit > 0 else 0
+
+        matched: List[Tuple[int, Dict[str, Any]]] = []
+        has_more = False
+        with self._lock:
+            if file_id:
+                record_id = self._by_file_id.get(normalize_file_id(file_id))
+                seqs = [self._seq[record_id]] if record_id else []
+            else:
+                index = bisect_left(self._order, before) if before is not None else len(self._order)
+                seqs = (self._order[i] for i in range(index - 1, -1, -1))
+
+            for seq in seqs:
+                if before is not None and seq >= before:
+                    continue
+                record_id = self._by_seq[seq]
+                record = self._records[record_id]
+                if keyword and keyword not in (record.get("filename") or "").lower():
+                    continue
+                if start or end:
+                    day = self._record_day.get(record_id)
+                    if day is None or (start and day < start) or (end and day > end):
+                        continue
+                if page_size and len(matched) >= page_size:
+                    has_more = True
+                    break
+                matched.append((seq, dict(record)))
+
+        # 未选择formats字段时不生成链接格式
+        with_formats = not fields or "formats" in fields
+        items = []
+        for _, record_data in matched:
+            record = UploadRecord.from_dict(record_data)
+            if with_thumbnails:
+                item = record.to_dict_with_thumbnail(self.thumbnail_manager, self.link_formatter, with_formats)
+            else:
+                item = record.to_dict(self.link_formatter, with_formats)
+            if fields:
+                item = {key: value for key, value in item.items() if key == "id" or key in fields}
+            items.append(item)
+
+        return {
+            "items": items,
+            "next_cursor": self.encode_cursor(matched[-1][0]) if has_more else None,
+            "has_more": has_more
+        }
+
     def get_record(self, record_id: str) -> Optional[UploadRecord]:
         """
         根据ID获取单条记录
         """
         try:
-            history = self._load_history()
-            
-            for record_data in history:
-                if record_data.get("id") == record_id:
-                    return UploadRecord.from_dict(record_data)
-            
-            return None
+            with self._lock:
+                record_data = self._records.get(record_id)
+                return UploadRecord.from_dict(record_data) if record_data else None
             
         except Exception as e:
             logger.error(f"[CloudImg123-History] 获取记录异常: {str(e)}")
@@ -238,13 +578,9 @@ class HistoryManager:
         根据file_id获取单条记录
         """
         try:
-            history = self._load_history()
-            
-            for record_data in history:
-                if record_data.get("file_id") == file_id:
-                    return UploadRecord.from_dict(record_data)
-            
-            return None
+            with self._lock:
+                record_id = self._by_file_id.get(normalize_file_id(file_id))
+                return self.get_record(record_id) if record_id else None
             
         except Exception as e:
             logger.error(f"[CloudImg123-History] 根据file_id获取记录异常: {str(e)}")
@@ -255,53 +591,98 @@ class HistoryManager:
         删除指定记录
         """
         try:
-            history = self._load_history()
-            
-            # 找到要删除的记录
-            record_to_delete = None
-            for record in history:
-                if record.get("id") == record_id:
-                    record_to_delete = record
-                    break
+            with self._lock:
+                record_to_delete = self._remove(record_id)
             
             if not record_to_delete:
                 logger.warning(f"[CloudImg123-History] 未找到要删除的记录: {record_id}")
                 return False
             
-            # 删除记录
-            history = [record for record in history if record.get("id") != record_id]
+            self._schedule_flush()
             
-            # 保存历史记录
-            success = self._save_history(history)
-            if success:
-                # 同步删除缩略图
-                file_id = record_to_delete.get("file_id")
-                if file_id:
-                    self.thumbnail_manager.delete_thumbnail(file_id)
-                
-                logger.info(f"[CloudImg123-History] 删除历史记录成功: {record_id}")
-            else:
-                logger.error(f"[CloudImg123-History] 删除历史记录保存失败: {record_id}")
+            # 同步删除缩略图
+            file_id = record_to_delete.get("file_id")
+            if file_id:
+                self.thumbnail_manager.delete_thumbnail(file_id)
             
-            return success
+            logger.info(f"[CloudImg123-History] 删除历史记录成功: {record_id}")
+            return True
                 
         except Exception as e:
             logger.error(f"[CloudImg123-History] 删除历史记录异常: {str(e)}")
             return False
 
+    async def delete_many(self, file_ids: List[str]) -> Dict[str, Any]:
+        """
+        按file_id批量删除记录
+
+        通过file_id索引一次性定位并移除全部记录，变更在一个事务中落盘，缩略图并行删除；
+        重复的file_id只处理一次，deleted即实际移除的记录数
+
+        :return: 汇总数量及按请求顺序排列的每个file_id的删除结果
+        """
+        file_ids = list(dict.fromkeys(normalize_file_id(file_id) for file_id in file_ids))
+        results: List[Dict[str, Any]] = []
+        removed: Dict[str, Dict[str, Any]] = {}
+
+        with self._lock:
+            for file_id in file_ids:
+                record_id = self._by_file_id.get(file_id) if file_id else None
+                record = self._remove(record_id) if record_id else None
+                if record is None:
+                    results.append({"file_id": file_id, "success": False, "message": "未找到记录"})
+                    continue
+
+                removed[file_id] = record
+                results.append({"file_id": file_id, "success": True, "record_id": record["id"],
+                                "filename": record.get("filename", ""), "message": "删除成功"})
+
+        if removed:
+            # 所有删除合并为一次落盘
+            saved = await asyncio.get_running_loop().run_in_executor(None, self.flush)
+            if not saved:
+                # 落盘失败时变更仍保留在待写入集合中，后续写入会重试
+                self._schedule_flush()
+
+            thumbnails = await self.thumbnail_manager.delete_thumbnails(list(removed))
+            for result in results:
+                if result["success"]:
+                    result["thumbnail_deleted"] = thumbnails.get(result["file_id"], False)
+
+        deleted = sum(1 for result in results if result["success"])
+        logger.info(f"[CloudImg123-History] 批量删除历史记录完成: {deleted}/{len(file_ids)}")
+        return {
+            "total": len(file_ids),
+            "deleted": deleted,
+            "failed": len(results) - deleted,
+            "results": results
+        }
+
     def clear_history(self) -> bool:
         """
         清空所有历史记录
         """
         try:
-            success = self._save_history([])
-            if success:
-                # 同步清空所有缩略图
-                self.thumbnail_manager.cleanup_all_thumbnails()
-                logger.info(f"[CloudImg123-History] 清空历史记录成功")
-            else:
-                logger.error(f"[CloudImg123-History] 清空历史记录失败")
-            return success
+            # 等待进行中的落盘完成，避免旧快照在清空后写回
+            with self._flush_lock, self._lock:
+                self._records.clear()
+                self._seq.clear()
+                self._order.clear()
+                self._by_seq.clear()
+                self._by_file_id.clear()
+                self._by_content.clear()
+                self._total_size = 0
+                self._daily_count.clear()
+                self._daily_size.clear()
+                self._record_day.clear()
+                self._dirty.clear()
+                self._deleted.clear()
+                self.store.clear()
+            
+            # 同步清空所有缩略图
+            self.thumbnail_manager.cleanup_all_thumbnails()
+            logger.info(f"[CloudImg123-History] 清空历史记录成功")
+            return True
             
         except Exception as e:
             logger.error(f"[CloudImg123-History] 清空历史记录异常: {str(e)}")
@@ -317,60 +698,78 @@ class HistoryManager:
             
             # 如果新限制更小，需要清理多余记录
             if new_limit < old_limit:
-                history = self._load_history()
-                if len(history) > new_limit:
-                    # 获取被删除记录的file_id
-                    removed_records = history[new_limit:]
-                    removed_file_ids = [record.get("file_id") for record in removed_records if record.get("file_id")]
+                with self._lock:
+                    removed_records = self._trim(new_limit)
+                
+                if removed_records:
+                    self._schedule_flush()
                     
-                    # 截断历史记录
-                    history = history[:new_limit]
-                    success = self._save_history(history)
+                    # 清理对应的缩略图
+                    for record in removed_records:
+                        if record.get("file_id"):
+                            self.thumbnail_manager.delete_thumbnail(record["file_id"])
                     
-                    if success:
-                        # 清理对应的缩略图
-                        for file_id in removed_file_ids:
-                            self.thumbnail_manager.delete_thumbnail(file_id)
-                        
-                        logger.info(f"[CloudImg123-History] 历史记录限制从 {old_limit} 更新为 {new_limit}，清理了多余记录")
-                    else:
-                        logger.error(f"[CloudImg123-History] 更新历史记录限制失败")
+                    logger.info(f"[CloudImg123-History] 历史记录限制从 {old_limit} 更新为 {new_limit}，清理了多余记录")
             else:
                 logger.info(f"[CloudImg123-History] 历史记录限制从 {old_limit} 更新为 {new_limit}")
                 
         except Exception as e:
             logger.error(f"[CloudImg123-History] 更新历史记录限制异常: {str(e)}")
 
-    def get_statistics(self) -> Dict[str, Any]:
+    def get_statistics(self, start: date = None, end: date = None) -> Dict[str, Any]:
         """
-        获取历史记录统计信息
+        获取历史记录统计信息（由增量维护的聚合直接得出，不遍历记录）
+
+        :param start: 统计范围起始日期（含），与end同时为空时不统计范围
+        :param end: 统计范围结束日期（含）
         """
         try:
-            history = self._load_history()
-            
-            if not history:
-                return {
-                    "total_count": 0,
-                    "total_size": 0,
-                    "latest_upload": None
+            with self._lock:
+                today = date.today()
+                stats = {
+                    "total_count": len(self._records),
+                    "total_size": self._total_size,
+                    "today_count": self._daily_count.get(today, 0),
+                    "today_size": self._daily_size.get(today, 0),
+                    "latest_upload": next(reversed(self._records.values())).get("upload_time") if self._records else None
                 }
-            
-            total_size = sum(record.get("file_size", 0) for record in history)
-            latest_upload = history[0].get("upload_time") if history else None
-            
-            return {
-                "total_count": len(history),
-                "total_size": total_size,
-                "latest_upload": latest_upload
-            }
+
+                if start is not None or end is not None:
+                    range_start = start or min(self._daily_count, default=today)
+                    range_end = end or today
+                    stats["range_count"], stats["range_size"] = self._sum_days(range_start, range_end)
+
+                return stats
             
         except Exception as e:
             logger.error(f"[CloudImg123-History] 获取统计信息异常: {str(e)}")
             return {
                 "total_count": 0,
                 "total_size": 0,
+                "today_count": 0,
+                "today_size": 0,
                 "latest_upload": None
             }
+
+    def get_daily_counts(self, start: date, end: date) -> List[Dict[str, Any]]:
+        """
+        获取[start, end]范围内每天的上传数量和大小，按日期升序排列
+        """
+        try:
+            with self._lock:
+                result = []
+                for offset in range((end - start).days + 1):
+                    day = start + timedelta(days=offset)
+                    result.append({
+                        "date": day.isoformat(),
+                        "uploads": self._daily_count.get(day, 0),
+                        "size": self._daily_size.get(day, 0)
+                    })
+                return result
+
+        except Exception as e:
+            logger.error(f"[CloudImg123-History] 获取每日统计异常: {str(e)}")
+            return []
     
     async def generate_thumbnail_for_record(self, file_id: str, image_url: str) -> bool:
         """
@@ -390,7 +789,7 @@ class HistoryManager:
     
     async def generate_all_thumbnails(self) -> Dict[str, Any]:
         """
-        为所有历史记录生成缩略图
+        为所有历史记录生成缩略图（后台并发执行，通过get_thumbnail_progress查询进度）
         """
         try:
             history = self._load_history()
@@ -403,36 +802,19 @@ class HistoryManager:
                     "message": "没有历史记录需要处理"
                 }
             
-            total = len(history)
-            generated = 0
-            failed = 0
-            
-            logger.info(f"[CloudImg123-History] 开始为 {total} 条记录生成缩略图")
+            items = [(record_data.get("file_id"), record_data.get("download_url")) for record_data in history]
+            status = self.thumbnail_manager.start_batch(items)
             
-            for record_data in history:
-                file_id = record_data.get("file_id")
-                download_url = record_data.get("download_url")
-                
-                if file_id and download_url:
-                    success = await self.generate_thumbnail_for_record(file_id, download_url)
-                    if success:
-                        generated += 1
-                    else:
-                        failed += 1
-                else:
-                    failed += 1
-            
-            result = {
+            logger.info(f"[CloudImg123-History] 已启动批量缩略图生成任务，共 {status['total']} 条记录")
+            return {
                 "success": True,
-                "total": total,
-                "generated": generated,
-                "failed": failed,
-                "message": f"完成缩略图生成：成功 {generated} 个，失败 {failed} 个"
+                "total": status["total"],
+                "generated": status["generated"],
+                "failed": status["failed"],
+                "message": "缩略图生成任务已在后台运行",
+                "data": status
             }
             
-            logger.info(f"[CloudImg123-History] {result['message']}")
-            return result
-            
         except Exception as e:
             logger.error(f"[CloudImg123-History] 批量生成缩略图异常: {str(e)}")
             return {
@@ -442,6 +824,12 @@ class HistoryManager:
                 "failed": 0,
                 "message": f"批量生成缩略图失败: {str(e)}"
             }
+
+    def get_thumbnail_progress(self) -> Optional[Dict[str, Any]]:
+        """
+        获取批量缩略图生成任务的进度，尚未启动过任务时返回None
+        """
+        return self.thumbnail_manager.get_batch_status()
     
     def get_thumbnail_cache_info(self) -> Dict[str, Any]:
         """
@@ -463,91 +851,105 @@ class HistoryManager:
         根据文件哈希获取记录
         """
         try:
-            history = self._load_history()
-            
-            for record_data in history:
-                if record_data.get("file_hash") == file_hash:
-                    return UploadRecord.from_dict(record_data)
-            
-            return None
+            return self.find_duplicate(file_hash=file_hash)
             
         except Exception as e:
             logger.error(f"[CloudImg123-History] 根据哈希获取记录异常: {str(e)}")
             return None
 
+    def find_duplicate(self, file_hash: str = None, etag: str = None) -> Optional[UploadRecord]:
+        """
+        通过内容哈希索引查找相同内容的记录（file_hash或etag任一命中即可）
+        """
+        with self._lock:
+            for key in (file_hash, etag):
+                record_id = self._by_content.get(key.lower()) if key else None
+                if record_id:
+                    return self.get_record(record_id)
+        return None
+
     def move_record_to_front(self, record_id: str) -> bool:
         """
         将指定记录移至历史记录最前面
         """
         try:
-            history = self._load_history()
-            
-            # 找到要移动的记录
-            record_to_move = None
-            for i, record in enumerate(history):
-                if record.get("id") == record_id:
-                    record_to_move = history.pop(i)
-                    break
-            
-            if not record_to_move:
-                logger.warning(f"[CloudImg123-History] 未找到要移动的记录: {record_id}")
-                return False
-            
-            # 将记录移至最前面
-            history.insert(0, record_to_move)
-            
-            # 保存历史记录
-            success = self._save_history(history)
-            if success:
-                logger.info(f"[CloudImg123-History] 记录移至最前面成功: {record_id}")
-            else:
-                logger.error(f"[CloudImg123-History] 记录移动保存失败: {record_id}")
+            with self._lock:
+                record = self._records.get(record_id)
+                if record is None:
+                    logger.warning(f"[CloudImg123-History] 未找到要移动的记录: {record_id}")
+                    return False
+                
+                # 将记录移至最前面
+                self._put_front(record)
             
-            return success
+            self._schedule_flush()
+            logger.info(f"[CloudImg123-History] 记录移至最前面成功: {record_id}")
+            return True
                 
         except Exception as e:
             logger.error(f"[CloudImg123-History] 移动记录异常: {str(e)}")
             return False
 
+    def update_links(self, links: Dict[str, Dict[str, Any]]) -> List[str]:
+        """
+        按file_id更新记录的下载链接（不改变记录顺序）
+
+        :param links: file_id -> {"download_url": str, "user_self_url": str}
+        :return: 链接实际发生变化的file_id列表
+        """
+        changed = []
+        try:
+            with self._lock:
+                for file_id, link in links.items():
+                    file_id = normalize_file_id(file_id)
+                    record_id = self._by_file_id.get(file_id)
+                    if not record_id or not link.get("download_url"):
+                        continue
+
+                    record = self._records[record_id]
+                    download_url = link["download_url"]
+                    user_self_url = link.get("user_self_url") or download_url
+                    if record.get("download_url") == download_url and record.get("user_self_url") == user_self_url:
+                        continue
+
+                    record["download_url"] = download_url
+                    record["user_self_url"] = user_self_url
+                    self._dirty.add(record_id)
+                    changed.append(file_id)
+
+            if changed:
+                self._schedule_flush()
+                logger.info(f"[CloudImg123-History] 更新下载链接 {len(changed)} 条")
+            return changed
+
+        except Exception as e:
+            logger.error(f"[CloudImg123-History] 更新下载链接异常: {str(e)}")
+            return changed
+
     def add_or_update_record(self, record: UploadRecord, check_duplicate: bool = True) -> bool:
         """
         添加或更新记录，支持重复检测和置顶处理
         """
         try:
-            history = self._load_history()
-            
-            # 检查重复（基于哈希值）
-            if check_duplicate and record.file_hash:
-                existing_record = None
-                existing_index = -1
+            with self._lock:
+                # 检查重复（基于哈希值），如果存在重复，先删除旧记录
+                if check_duplicate:
+                    for key in self._content_keys(record.to_storage_dict()):
+                        existing_id = self._by_content.get(key)
+                        if existing_id and existing_id != record.id:
+                            self._remove(existing_id)
+                            logger.info(f"[CloudImg123-History] 发现重复记录，将替换: {record.filename}")
                 
-                for i, record_data in enumerate(history):
-                    if record_data.get("file_hash") == record.file_hash:
-                        existing_record = record_data
-                        existing_index = i
-                        break
+                # 添加新记录到开头
+                self._put_front(record.to_storage_dict())
                 
-                # 如果存在重复，先删除旧记录
-                if existing_record:
-                    history.pop(existing_index)
-                    logger.info(f"[CloudImg123-History] 发现重复记录，将替换: {record.filename}")
+                # 限制历史记录数量
+                if self._trim(self.limit):
+                    logger.info(f"[CloudImg123-History] 历史记录超出限制，保留最新 {self.limit} 条")
             
-            # 添加新记录到开头
-            history.insert(0, record.to_dict())
-            
-            # 限制历史记录数量
-            if self.limit > 0 and len(history) > self.limit:
-                history = history[:self.limit]
-                logger.info(f"[CloudImg123-History] 历史记录超出限制，保留最新 {self.limit} 条")
-            
-            # 保存到文件
-            success = self._save_history(history)
-            if success:
-                logger.info(f"[CloudImg123-History] 添加/更新历史记录成功: {record.filename}")
-            else:
-                logger.error(f"[CloudImg123-History] 添加/更新历史记录失败: {record.filename}")
-                
-            return success
+            self._schedule_flush()
+            logger.info(f"[CloudImg123-History] 添加/更新历史记录成功: {record.filename}")
+            return True
             
         except Exception as e:
             logger.error(f"[CloudImg123-History] 添加/更新历史记录异常: {str(e)}")
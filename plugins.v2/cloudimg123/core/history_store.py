@@ -0,0 +1,167 @@
+"""
+历史记录存储
+使用SQLite保存上传记录，按id、file_id、file_hash、etag和upload_time建立索引
+"""
+
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from typing import List, Dict, Any, Tuple
+
+from app.log import logger
+
+
+# 记录字段（与UploadRecord对应）
+RECORD_FIELDS = (
+    "id", "filename", "file_id", "file_hash", "etag", "download_url",
+    "user_self_url", "file_size", "upload_time"
+)
+
+
+class HistoryStore:
+    """
+    基于SQLite的上传历史存储
+
+    记录顺序由seq列决定，seq越大越靠前；置顶操作只需为记录分配新的最大seq
+    """
+
+    def __init__(self, db_path: Path, legacy_json: Path = None):
+        self.db_path = db_path
+        self.legacy_json = legacy_json
+        self._lock = threading.RLock()
+
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._init_schema()
+
+        if legacy_json is not None:
+            self._migrate_from_json(legacy_json)
+
+    def _init_schema(self):
+        """
+        初始化表结构和索引
+        """
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS upload_history (
+                    id TEXT PRIMARY KEY,
+                    seq INTEGER NOT NULL,
+                    filename TEXT NOT NULL DEFAULT '',
+                    file_id TEXT NOT NULL DEFAULT '',
+                    file_hash TEXT,
+                    etag TEXT,
+                    download_url TEXT NOT NULL DEFAULT '',
+                    user_self_url TEXT NOT NULL DEFAULT '',
+                    file_size INTEGER NOT NULL DEFAULT 0,
+                    upload_time TEXT NOT NULL DEFAULT ''
+                )
+            """)
+            self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_history_seq ON upload_history (seq)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_history_file_id ON upload_history (file_id)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_history_file_hash ON upload_history (file_hash)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_history_etag ON upload_history (etag)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_history_upload_time ON upload_history (upload_time)")
+
+    def _migrate_from_json(self, legacy_json: Path):
+        """
+        从旧版upload_history.json迁移记录（仅在数据库为空时执行一次）
+        """
+        try:
+            if not legacy_json.exists():
+                return
+
+            with self._lock:
+                if self.count() > 0:
+                    return
+
+                with open(legacy_json, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                history = data if isinstance(data, list) else []
+
+                # JSON中第一条是最新记录，seq从大到小分配
+                total = len(history)
+                with self._conn:
+                    for index, record in enumerate(history):
+                        self._insert(record, total - index)
+
+            legacy_json.rename(legacy_json.with_name(legacy_json.name + ".migrated"))
+            logger.info(f"[CloudImg123-History] 已从 {legacy_json.name} 迁移 {total} 条历史记录")
+
+        except Exception as e:
+            logger.error(f"[CloudImg123-History] 迁移旧版历史记录失败: {str(e)}")
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+        """
+        数据库行转换为记录字典
+        """
+        return {field: row[field] for field in RECORD_FIELDS}
+
+    def _insert(self, record: Dict[str, Any], seq: int):
+        """
+        写入一条记录（调用方负责事务）
+        """
+        self._conn.execute(
+            """
+            INSERT OR REPLACE INTO upload_history
+                (id, seq, filename, file_id, file_hash, etag, download_url, user_self_url, file_size, upload_time)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+            (
+                record.get("id"),
+                seq,
+                record.get("filename", ""),
+                record.get("file_id", ""),
+                record.get("file_hash"),
+                record.get("etag"),
+                record.get("download_url", ""),
+                record.get("user_self_url", ""),
+                record.get("file_size", 0) or 0,
+                record.get("upload_time", ""),
+            )
+        )
+
+    def count(self) -> int:
+        """
+        记录总数
+        """
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM upload_history").fetchone()[0]
+
+    def load_all(self) -> List[Tuple[int, Dict[str, Any]]]:
+        """
+        按从旧到新的顺序读取全部记录及其序号
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT * FROM upload_history ORDER BY seq ASC").fetchall()
+        return [(row["seq"], self._row_to_dict(row)) for row in rows]
+
+    def apply_changes(self, upserts: List[Tuple[Dict[str, Any], int]], deletes: List[str]):
+        """
+        在一个事务中写入一批变更
+
+        :param upserts: 需要新增或更新的(记录, 序号)
+        :param deletes: 需要删除的记录ID
+        """
+        with self._lock, self._conn:
+            if deletes:
+                self._conn.executemany("DELETE FROM upload_history WHERE id = ?", [(record_id,) for record_id in deletes])
+            for record, seq in upserts:
+                self._insert(record, seq)
+
+    def clear(self):
+        """
+        清空所有记录
+        """
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM upload_history")
+
+    def close(self):
+        """
+        关闭数据库连接
+        """
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,114 @@
+"""
+共享HTTP会话
+为API客户端提供带连接池、keep-alive和DNS缓存的长连接会话
+"""
+
+import asyncio
+from typing import Dict, Optional
+
+import aiohttp
+
+from app.log import logger
+from .rate_limit import HostRateLimiter
+
+
+class SharedSession:
+    """
+    延迟创建的共享aiohttp会话
+
+    会话在首次使用时于当前运行的事件循环上创建，并与该循环绑定；每个事件循环各自持有一个会话，
+    其他事件循环（例如test_connection中的临时循环）使用和关闭自己的会话，不影响主循环上进行中的请求
+    """
+
+    def __init__(self, name: str, limit: int = 32, limit_per_host: int = 16,
+                 keepalive_timeout: float = 60, dns_ttl: int = 300,
+                 total_timeout: float = 300, connect_timeout: float = 30,
+                 rate_limiter: HostRateLimiter = None):
+        self.name = name
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_ttl = dns_ttl
+        self.total_timeout = total_timeout
+        self.connect_timeout = connect_timeout
+        # 按主机限速（可选），会话发出的每个请求发送前都会经过限速器
+        self.rate_limiter = rate_limiter
+
+        # 事件循环 -> 该循环上的会话
+        self._sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+
+    def _create_session(self) -> aiohttp.ClientSession:
+        """
+        创建带连接池的会话
+        """
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            limit_per_host=self.limit_per_host,
+            keepalive_timeout=self.keepalive_timeout,
+            ttl_dns_cache=self.dns_ttl,
+            use_dns_cache=True
+        )
+        timeout = aiohttp.ClientTimeout(total=self.total_timeout, connect=self.connect_timeout)
+        trace_configs = [self.rate_limiter.trace_config()] if self.rate_limiter is not None else None
+        return aiohttp.ClientSession(connector=connector, timeout=timeout, trace_configs=trace_configs)
+
+    async def get(self) -> aiohttp.ClientSession:
+        """
+        获取当前事件循环上的共享会话，必要时创建
+        """
+        loop = asyncio.get_running_loop()
+
+        session = self._sessions.get(loop)
+        if session is not None and not session.closed:
+            return session
+
+        # 清理已关闭的事件循环遗留的会话（循环关闭后无法再在其上关闭会话）
+        for stale_loop in [stale for stale in self._sessions if stale.is_closed()]:
+            del self._sessions[stale_loop]
+
+        session = self._create_session()
+        self._sessions[loop] = session
+        logger.debug(f"[{self.name}] 创建共享HTTP会话")
+        return session
+
+    async def aclose(self):
+        """
+        关闭当前事件循环上的会话，其他事件循环上的会话不受影响
+        """
+        session = self._sessions.pop(asyncio.get_running_loop(), None)
+        if session is not None and not session.closed:
+            await session.close()
+            logger.debug(f"[{self.name}] 共享HTTP会话已关闭")
+
+    def close(self):
+        """
+        同步关闭所有事件循环上的会话（用于插件停止等非协程上下文）
+        """
+        sessions, self._sessions = self._sessions, {}
+        for loop, session in sessions.items():
+            self._close_detached(session, loop)
+
+    def _close_detached(self, session: aiohttp.ClientSession, loop: Optional[asyncio.AbstractEventLoop]):
+        """
+        在会话所属的事件循环上关闭会话
+        """
+        try:
+            if session.closed or loop is None or loop.is_closed():
+                return
+
+            try:
+                running_loop = asyncio.get_running_loop()
+            except RuntimeError:
+                running_loop = None
+
+            if running_loop is loop:
+                loop.create_task(session.close())
+            elif loop.is_running():
+                asyncio.run_coroutine_threadsafe(session.close(), loop)
+            else:
+                loop.run_until_complete(session.close())
+
+            logger.debug(f"[{self.name}] 共享HTTP会话已关闭")
+
+        except Exception as e:
+            logger.warning(f"[{self.name}] 关闭HTTP会话异常: {str(e)}")
@@ -0,0 +1,142 @@
+"""
+上传文件接收
+将请求体分块写入临时文件，同一遍读取中计算MD5并识别图片格式
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from typing import Optional
+
+from app.log import logger
+
+
+# 每次从请求体读取的块大小
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# 常见图片格式的文件头
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+    (b'II*\x00', 'tiff'),
+    (b'MM\x00*', 'tiff'),
+    (b'II+\x00', 'tiff'),
+    (b'MM\x00+', 'tiff'),
+    (b'\x00\x00\x01\x00', 'ico'),
+)
+
+
+def sniff_image_type(header: bytes) -> Optional[str]:
+    """
+    根据文件头识别图片格式，无法识别时返回None
+    """
+    if not header:
+        return None
+
+    for signature, image_type in IMAGE_SIGNATURES:
+        if header.startswith(signature):
+            return image_type
+
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+
+    if b'<svg' in header[:4096].lower():
+        return 'svg'
+
+    return None
+
+
+class SpooledUpload:
+    """
+    已写入临时文件的上传内容
+
+    临时文件按引用计数管理：创建者持有一个引用，需要在请求结束后继续读取文件的后台任务
+    （如缩略图生成）先调用retain()，用完后release()，最后一个引用释放时删除文件
+    """
+
+    def __init__(self, path: str, size: int, md5, image_type: Optional[str]):
+        self.path = path
+        self.size = size
+        self.md5 = md5  # hashlib摘要对象，内容与123云盘要求的etag一致
+        self.image_type = image_type
+        self._refs = 1
+        self._refs_lock = threading.Lock()
+
+    @property
+    def md5_hex(self) -> str:
+        """
+        文件MD5（十六进制）
+        """
+        return self.md5.hexdigest()
+
+    def retain(self) -> "SpooledUpload":
+        """
+        增加一个引用，保证临时文件在release()之前不会被删除
+        """
+        with self._refs_lock:
+            self._refs += 1
+        return self
+
+    def release(self):
+        """
+        释放一个引用，引用归零时删除临时文件
+        """
+        with self._refs_lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return
+        self._remove()
+
+    def cleanup(self):
+        """
+        释放创建者持有的引用（其他引用仍在使用时延后删除临时文件）
+        """
+        self.release()
+
+    def _remove(self):
+        """
+        删除临时文件
+        """
+        try:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+        except Exception as e:
+            logger.warning(f"[CloudImg123-Ingest] 清理临时文件失败: {self.path}, {str(e)}")
+
+
+async def spool_upload(upload_file, filename: str, chunk_size: int = SPOOL_CHUNK_SIZE) -> SpooledUpload:
+    """
+    将UploadFile分块写入临时文件，同时计算MD5并识别图片格式
+    """
+    md5 = hashlib.md5()
+    size = 0
+    image_type = None
+
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=f"_{filename}")
+    try:
+        with temp_file:
+            while True:
+                chunk = await upload_file.read(chunk_size)
+                if not chunk:
+                    break
+
+                if size == 0:
+                    image_type = sniff_image_type(chunk)
+
+                md5.update(chunk)
+                temp_file.write(chunk)
+                size += len(chunk)
+
+    except Exception:
+        try:
+            os.unlink(temp_file.name)
+        except OSError:
+            pass
+        raise
+
+    logger.debug(f"[CloudImg123-Ingest] 接收文件完成: {filename}，大小: {size} bytes，格式: {image_type}")
+    return SpooledUpload(temp_file.name, size, md5, image_type)
@@ -0,0 +1,159 @@
+"""
+链接格式模板
+由记录的download_url和filename按模板即时生成URL、HTML、Markdown、BBCode等链接，记录本身不再保存格式字符串
+"""
+
+import html
+import re
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple, Union
+from urllib.parse import quote
+
+from app.log import logger
+
+
+# 内置模板，与前端使用的url/html/markdown/bbcode字段对应
+DEFAULT_TEMPLATES: Dict[str, str] = {
+    "url": "{url}",
+    "html": '<img src="{url}" alt="{name}" title="{filename}">',
+    "markdown": '![{name}]({url} "{filename}")',
+    "bbcode": "[img]{url}[/img]"
+}
+
+# 模板占位符：{变量} 或 {变量|过滤器}，{{ 和 }} 表示字面量花括号
+_TOKEN_PATTERN = re.compile(r"\{\{|\}\}|\{(\w+)(?:\|(\w+))?\}")
+
+# 可用的过滤器
+_FILTERS: Dict[str, Callable[[str], str]] = {
+    "html": lambda value: html.escape(value, quote=True),
+    "url": lambda value: quote(value, safe=""),
+    "upper": str.upper,
+    "lower": str.lower
+}
+
+# 可用的变量
+TEMPLATE_VARIABLES = ("url", "filename", "name", "ext", "file_id", "size")
+
+
+class LinkFormatter:
+    """
+    链接格式生成器
+
+    模板在设置时编译为字面量与变量片段的列表，渲染时只做拼接；
+    未知变量或过滤器按原文保留，渲染不会因用户模板书写错误而失败
+    """
+
+    def __init__(self, templates: Dict[str, str] = None):
+        self._compiled: Dict[str, List[Union[str, Tuple[str, Callable]]]] = {}
+        self.templates: Dict[str, str] = {}
+        self.set_templates(templates)
+
+    def set_templates(self, templates: Dict[str, str] = None):
+        """
+        设置自定义模板（在内置模板基础上新增或覆盖，模板为空字符串时移除该格式）
+        """
+        merged = dict(DEFAULT_TEMPLATES)
+        for name, template in (templates or {}).items():
+            name = str(name).strip()
+            if not name:
+                continue
+            if template:
+                merged[name] = str(template)
+            else:
+                merged.pop(name, None)
+
+        self._compiled = {name: self._compile(template) for name, template in merged.items()}
+        self.templates = merged
+
+    @staticmethod
+    def parse_templates(value: Any) -> Dict[str, str]:
+        """
+        解析配置中的模板：支持字典，或每行一条"名称=模板"的文本（#开头的行为注释）
+        """
+        if not value:
+            return {}
+        if isinstance(value, dict):
+            return {str(name): str(template) if template else "" for name, template in value.items()}
+
+        templates = {}
+        for line in str(value).splitlines():
+            line = line.strip()
+            if not line or line.startswith("#") or "=" not in line:
+                continue
+            name, template = line.split("=", 1)
+            templates[name.strip()] = template.strip()
+        return templates
+
+    @staticmethod
+    def _compile(template: str) -> List[Union[str, Tuple[str, Callable]]]:
+        """
+        将模板编译为字面量字符串与(变量名, 过滤器)片段的列表
+        """
+        parts: List[Union[str, Tuple[str, Callable]]] = []
+        literal = ""
+        position = 0
+        for match in _TOKEN_PATTERN.finditer(template):
+            literal += template[position:match.start()]
+            position = match.end()
+            token, variable, filter_name = match.group(0), match.group(1), match.group(2)
+
+            if token in ("{{", "}}"):
+                literal += token[0]
+            elif variable not in TEMPLATE_VARIABLES or (filter_name and filter_name not in _FILTERS):
+                literal += token
+            else:
+                if literal:
+                    parts.append(literal)
+                    literal = ""
+                parts.append((variable, _FILTERS.get(filter_name)))
+
+        literal += template[position:]
+        if literal:
+            parts.append(literal)
+        return parts
+
+    @staticmethod
+    def _variables(download_url: str, filename: str, file_id: str = "", file_size: int = 0) -> Dict[str, str]:
+        """
+        模板变量取值
+        """
+        path = Path(filename or "")
+        return {
+            "url": download_url or "",
+            "filename": filename or "",
+            "name": path.stem,
+            "ext": path.suffix.lstrip("."),
+            "file_id": str(file_id or ""),
+            "size": str(file_size or 0)
+        }
+
+    def render(self, download_url: str, filename: str, file_id: str = "", file_size: int = 0) -> Dict[str, str]:
+        """
+        生成全部格式的链接
+        """
+        try:
+            variables = self._variables(download_url, filename, file_id, file_size)
+            formats = {}
+            for name, parts in self._compiled.items():
+                chunks = []
+                for part in parts:
+                    if isinstance(part, str):
+                        chunks.append(part)
+                    else:
+                        value = variables[part[0]]
+                        chunks.append(part[1](value) if part[1] else value)
+                formats[name] = "".join(chunks)
+            return formats
+
+        except Exception as e:
+            logger.error(f"[CloudImg123-Links] 生成链接格式异常: {str(e)}")
+            return {
+                "url": download_url,
+                "html": f'<img src="{download_url}" alt="{filename}">',
+                "markdown": f'![{filename}]({download_url})',
+                "bbcode": f'[img]{download_url}[/img]'
+            }
+
+
+# 未配置自定义模板时使用的默认生成器
+default_formatter = LinkFormatter()
@@ -0,0 +1,98 @@
+"""
+请求限速
+按主机划分的令牌桶，限制对同一主机每秒发起的请求数
+"""
+
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+
+import aiohttp
+
+
+class TokenBucket:
+    """
+    令牌桶：以rate个/秒的速度补充令牌，最多积攒burst个；每个请求消耗一个令牌，不足时等待
+    """
+
+    def __init__(self, rate: float, burst: int = None):
+        self.rate = float(rate)
+        self.burst = max(int(burst or rate), 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock: Optional[asyncio.Lock] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_lock(self) -> asyncio.Lock:
+        """
+        获取绑定当前事件循环的锁（事件循环切换时重建）
+        """
+        loop = asyncio.get_running_loop()
+        if self._lock is None or self._loop is not loop:
+            self._lock = asyncio.Lock()
+            self._loop = loop
+        return self._lock
+
+    async def acquire(self):
+        """
+        取得一个令牌；等待时持有锁，保证等待方按到达顺序依次放行
+        """
+        async with self._get_lock():
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class HostRateLimiter:
+    """
+    按主机限速
+
+    每个主机使用独立的令牌桶；未在host_limits中单独配置的主机使用默认速率，速率为0表示不限速
+    """
+
+    def __init__(self, rate: float = 0, burst: int = None, host_limits: Dict[str, Tuple[float, int]] = None):
+        self.rate = rate
+        self.burst = burst
+        self.host_limits = dict(host_limits or {})
+        self._buckets: Dict[str, Optional[TokenBucket]] = {}
+
+    def configure(self, rate: float, burst: int = None):
+        """
+        修改默认速率，已创建的令牌桶按新速率重建
+        """
+        self.rate = rate
+        self.burst = burst
+        self._buckets.clear()
+
+    def _bucket(self, host: str) -> Optional[TokenBucket]:
+        """
+        获取主机对应的令牌桶，不限速时返回None
+        """
+        if host not in self._buckets:
+            rate, burst = self.host_limits.get(host, (self.rate, self.burst))
+            self._buckets[host] = TokenBucket(rate, burst) if rate and rate > 0 else None
+        return self._buckets[host]
+
+    async def acquire(self, host: str):
+        """
+        向指定主机发起请求前调用，必要时等待
+        """
+        bucket = self._bucket(host or "")
+        if bucket is not None:
+            await bucket.acquire()
+
+    def trace_config(self) -> aiohttp.TraceConfig:
+        """
+        生成aiohttp的TraceConfig，使会话发出的每个请求在发送前先经过限速
+        """
+        async def on_request_start(session, context, params):
+            await self.acquire(params.url.host)
+
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        return trace_config
@@ -230,13 +230,7 @@ class CloudImg123Tester:
                 filename="test_image.jpg",
                 file_id="test_file_id",
                 download_url="https://example.com/test.jpg",
-                file_size=102400,
-                formats={
-                    "url": "https://example.com/test.jpg",
-                    "html": '<img src="https://example.com/test.jpg" alt="test_image">',
-                    "markdown": '![test_image](https://example.com/test.jpg)',
-                    "bbcode": '[img]https://example.com/test.jpg[/img]'
-                }
+                file_size=102400
             )
             
             # 添加记录
@@ -261,6 +255,74 @@ class CloudImg123Tester:
             print(f"✗ 历史管理器测试异常: {e}")
             return False
 
+    def test_history_query_by_file_id(self):
+        """测试按file_id查询刚添加的记录"""
+        try:
+            print("\n--- 测试按file_id查询历史记录 ---")
+
+            # 上传流程得到的是123云盘返回的数字fileID，/history接口以字符串形式传入
+            file_id = 9000002
+            test_record = UploadRecord(
+                filename="test_query.jpg",
+                file_id=file_id,
+                download_url="https://example.com/test_query.jpg",
+                file_size=2048
+            )
+            if not self.history_manager.add_record(test_record):
+                print("✗ 添加测试记录失败")
+                return False
+
+            try:
+                items = self.history_manager.query_history(file_id=str(file_id))["items"]
+                if len(items) == 1 and items[0]["file_id"] == str(file_id):
+                    print("✓ 按file_id查询到刚添加的记录")
+                    return True
+                print(f"✗ 按file_id未查询到刚添加的记录: {items}")
+                return False
+
+            finally:
+                self.history_manager.delete_record(test_record.id)
+
+        except Exception as e:
+            print(f"✗ 按file_id查询测试异常: {e}")
+            return False
+
+    async def test_thumbnail_pack(self):
+        """测试批量缩略图打包（上传流程内联生成的缩略图）"""
+        try:
+            print("\n--- 测试批量缩略图打包 ---")
+
+            from PIL import Image
+
+            # 上传流程使用本地临时文件生成缩略图，file_id为123云盘返回的数字fileID
+            test_image_path = self.config_path / "test_pack.png"
+            Image.new("RGB", (320, 240), (200, 80, 40)).save(test_image_path, "PNG")
+            file_id = 9000001
+
+            thumbnail_manager = self.history_manager.thumbnail_manager
+            try:
+                await thumbnail_manager.generate_from_file(str(test_image_path), file_id)
+
+                # /thumbnails接口以字符串形式传入file_id
+                _, payload = thumbnail_manager.build_pack([str(file_id)])
+                index, _ = thumbnail_manager.unpack(payload)
+                packed = [item["file_id"] for item in index["items"]]
+
+                if packed == [str(file_id)] and not index["missing"]:
+                    print("✓ 内联生成的缩略图可通过批量接口获取")
+                    return True
+                print(f"✗ 批量接口未找到内联生成的缩略图: items={packed}, missing={index['missing']}")
+                return False
+
+            finally:
+                thumbnail_manager.delete_thumbnail(file_id)
+                if test_image_path.exists():
+                    test_image_path.unlink()
+
+        except Exception as e:
+            print(f"✗ 批量缩略图打包测试异常: {e}")
+            return False
+
     def test_file_validation(self):
         """测试文件验证"""
         try:
@@ -330,6 +392,8 @@ class CloudImg123Tester:
                 ("API连接测试", self.test_api_connection()),
                 ("Token管理测试", self.test_token_manager()),
                 ("历史管理器测试", self.test_history_manager()),
+                ("按file_id查询测试", self.test_history_query_by_file_id()),
+                ("批量缩略图打包测试", self.test_thumbnail_pack()),
                 ("文件验证测试", self.test_file_validation()),
                 ("上传能力测试", self.test_upload_capability())
             ]
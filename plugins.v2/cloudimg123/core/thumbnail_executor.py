@@ -0,0 +1,121 @@
+"""
+缩略图渲染执行器
+在专用线程池中执行Pillow解码、缩放和编码，并按解码后占用的字节数控制同时处理的任务量
+"""
+
+import asyncio
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, List
+
+from app.log import logger
+
+
+class ThumbnailExecutor:
+    """
+    按字节预算排队的渲染线程池
+
+    每个任务提交时声明其代价（预计解码后的字节数），进行中的任务代价之和不超过max_pending_bytes；
+    超出预算的任务按提交顺序排队等待，单个超过预算的任务会在队列空闲时单独执行
+    """
+
+    def __init__(self, max_workers: int = None, max_pending_bytes: int = 256 * 1024 * 1024):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_pending_bytes = max_pending_bytes
+
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="cloudimg123-thumb")
+        self._lock = threading.Lock()
+        self._pending_bytes = 0
+        self._running = 0
+        # 等待队列元素: [代价, 所属事件循环, future, 是否已获准]
+        self._waiters: Deque[List[Any]] = deque()
+
+    async def run(self, cost: int, func: Callable, *args) -> Any:
+        """
+        在字节预算允许时于线程池中执行func，并等待其结果
+        """
+        cost = min(max(int(cost), 1), self.max_pending_bytes)
+        await self._acquire(cost)
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, func, *args)
+        finally:
+            self._release(cost)
+
+    async def _acquire(self, cost: int):
+        """
+        申请字节预算，不足时排队等待
+        """
+        with self._lock:
+            if not self._waiters and self._pending_bytes + cost <= self.max_pending_bytes:
+                self._pending_bytes += cost
+                self._running += 1
+                return
+
+            loop = asyncio.get_running_loop()
+            waiter = [cost, loop, loop.create_future(), False]
+            self._waiters.append(waiter)
+
+        try:
+            await waiter[2]
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter[3]
+                if not granted:
+                    self._waiters.remove(waiter)
+            # 已获准但调用方被取消，归还预算
+            if granted:
+                self._release(cost)
+            raise
+
+    def _release(self, cost: int):
+        """
+        归还字节预算，并按顺序放行队列中可以执行的任务
+        """
+        with self._lock:
+            self._pending_bytes -= cost
+            self._running -= 1
+
+            while self._waiters:
+                next_cost = self._waiters[0][0]
+                if self._running > 0 and self._pending_bytes + next_cost > self.max_pending_bytes:
+                    break
+
+                waiter = self._waiters.popleft()
+                waiter[3] = True
+                self._pending_bytes += next_cost
+                self._running += 1
+                try:
+                    waiter[1].call_soon_threadsafe(self._wake, waiter[2])
+                except RuntimeError:
+                    # 等待方的事件循环已关闭，收回预算
+                    self._pending_bytes -= next_cost
+                    self._running -= 1
+
+    @staticmethod
+    def _wake(future: asyncio.Future):
+        if not future.done():
+            future.set_result(None)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        执行器状态
+        """
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "running": self._running,
+                "queued": len(self._waiters),
+                "pending_bytes": self._pending_bytes,
+                "max_pending_bytes": self.max_pending_bytes
+            }
+
+    def shutdown(self):
+        """
+        关闭线程池（不等待进行中的任务）
+        """
+        try:
+            self._pool.shutdown(wait=False)
+        except Exception as e:
+            logger.warning(f"[CloudImg123-Thumbnail] 关闭渲染线程池异常: {str(e)}")
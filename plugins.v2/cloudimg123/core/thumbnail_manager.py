@@ -5,30 +5,159 @@
 
 import os
 import asyncio
-import aiohttp
+import hashlib
+import json
+import struct
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import Optional, Tuple, List, Dict, Any, Union, Callable
 from PIL import Image
 import io
 
 from app.log import logger
-from .utils import ensure_directory_exists, calculate_file_hash
+from .http_session import SharedSession
+from .thumbnail_executor import ThumbnailExecutor
+from .utils import ensure_directory_exists, calculate_file_hash, normalize_file_id
+
+
+def avif_supported() -> bool:
+    """
+    当前Pillow是否支持编码AVIF（Pillow 11.2+内置，旧版本可通过pillow-avif-plugin提供）
+    """
+    try:
+        import pillow_avif  # noqa: F401
+    except ImportError:
+        pass
+
+    try:
+        Image.init()
+        return "AVIF" in Image.SAVE
+    except Exception:
+        return False
+
+
+class ThumbnailBatchJob:
+    """
+    批量缩略图生成任务的进度
+    """
+
+    def __init__(self, total: int, concurrency: int):
+        self.total = total
+        self.concurrency = concurrency
+        self.generated = 0
+        self.skipped = 0
+        self.failed = 0
+        self.running = True
+        self.cancelled = False
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.failed_ids: List[str] = []
+
+    @property
+    def processed(self) -> int:
+        return self.generated + self.skipped + self.failed
+
+    def to_dict(self) -> Dict[str, Any]:
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return {
+            "running": self.running,
+            "cancelled": self.cancelled,
+            "total": self.total,
+            "processed": self.processed,
+            "generated": self.generated,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "failed_ids": self.failed_ids[:50],
+            "concurrency": self.concurrency,
+            "progress": round(self.processed * 100 / self.total, 1) if self.total else 100.0,
+            "elapsed": round(elapsed, 2)
+        }
 
 
 class ThumbnailManager:
     """
     缩略图管理器，负责图片缩略图的生成和缓存
     """
+
+    # 缩略图变体：尺寸（正方形框边长）和默认变体（文件名为{file_id}.webp，兼容旧版缓存）
+    VARIANT_SIZES = (64, 200, 480)
+    DEFAULT_VARIANT_SIZE = 200
+    DEFAULT_VARIANT = "200.webp"
+
+    # 变体格式 -> (Pillow格式, 编码参数)；AVIF仅在Pillow支持时生成
+    FORMAT_OPTIONS = {
+        "webp": ("WEBP", {"quality": 85, "optimize": True}),
+        "avif": ("AVIF", {"quality": 60, "speed": 8}),
+    }
+
+    # 缩略图文件扩展名对应的MIME类型
+    MIME_TYPES = {
+        ".webp": "image/webp",
+        ".avif": "image/avif",
+        ".jpg": "image/jpeg",
+        ".png": "image/png",
+    }
+
+    # 批量打包：单次请求最多包含的缩略图数量，以及打包结果缓存的条目数和字节上限
+    PACK_MAX_ITEMS = 200
+    PACK_CACHE_ENTRIES = 16
+    PACK_CACHE_BYTES = 16 * 1024 * 1024
+
+    # 超出容量上限后延迟多少秒淘汰，以及淘汰到上限的多少比例为止（留出余量避免频繁淘汰）
+    EVICT_DELAY = 1.0
+    EVICT_TARGET_RATIO = 0.9
+
+    # (最大缩小倍数, 重采样滤镜)，按顺序匹配
+    RESAMPLE_BY_RATIO = (
+        (2.0, Image.Resampling.LANCZOS),
+        (4.0, Image.Resampling.BICUBIC),
+        (float("inf"), Image.Resampling.HAMMING),
+    )
     
-    def __init__(self, config_path: Path):
+    def __init__(self, config_path: Path, concurrency: int = 4):
         self.config_path = config_path
         self.cache_dir = config_path / "cache" / "thumbnails"
-        self.thumbnail_size = (200, 200)  # 缩略图尺寸
-        self.thumbnail_format = "WEBP"  # 使用WebP格式节省空间
-        self.thumbnail_quality = 85  # 缩略图质量
+        self.variant_sizes = self.VARIANT_SIZES  # 生成的缩略图尺寸
+        self.variant_formats = ("webp", "avif") if avif_supported() else ("webp",)  # 生成的缩略图格式
+        self.concurrency = max(1, int(concurrency or 1))  # 批量生成时的并发下载数
+
+        # 下载原图复用同一个连接池
+        self._http = SharedSession("CloudImg123-Thumbnail", limit=max(16, self.concurrency * 2),
+                                   limit_per_host=max(8, self.concurrency))
+        # 解码、缩放、编码等CPU工作在专用执行器中执行，按解码内存排队，不阻塞事件循环
+        self._executor = ThumbnailExecutor()
+
+        # 当前（或最近一次）批量生成任务
+        self._batch_job: Optional[ThumbnailBatchJob] = None
+        self._batch_task: Optional[asyncio.Task] = None
+        # 上传后由本地文件生成缩略图的后台任务: file_id -> task
+        self._inline_tasks: Dict[str, asyncio.Task] = {}
+
+        # 批量缩略图打包结果的LRU缓存: 集合ETag -> 打包内容
+        self._pack_cache: "OrderedDict[str, bytes]" = OrderedDict()
+        self._pack_cache_bytes = 0
+        self._pack_lock = threading.Lock()
         
         # 确保缓存目录存在
         self._ensure_cache_directory()
+
+        # 缓存容量上限（0表示不限制），超出后按LRU顺序在后台淘汰
+        self.cache_max_bytes = 0
+        self.cache_max_entries = 0
+        self._evict_timer: Optional[threading.Timer] = None
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._evicted_bytes = 0
+
+        # 缩略图清单: file_id -> {变体: (文件大小, 修改时间ns)}，按最近使用排序（末尾为最近使用）；
+        # 启动时扫描一次，之后随写入、访问和删除更新，同一file_id的全部变体一起淘汰
+        self._manifest: "OrderedDict[str, Dict[str, Tuple[int, int]]]" = OrderedDict()
+        self._manifest_bytes = 0
+        self._manifest_lock = threading.Lock()
+        self._load_manifest()
     
     def _ensure_cache_directory(self):
         """确保缓存目录存在"""
@@ -49,129 +178,715 @@ class ThumbnailManager:
         elif level == "warning":
             logger.warning(log_message)
 
-    def get_thumbnail_path(self, file_id: str) -> Optional[Path]:
+    def resolve_cached_file(self, file_name: str) -> Optional[Tuple[Path, os.stat_result]]:
         """
-        获取缩略图文件路径
+        解析缓存目录中的缩略图文件，返回(路径, stat结果)；文件不存在、为空或路径越出缓存目录时返回None
         """
         try:
-            thumbnail_filename = f"{file_id}.webp"
-            thumbnail_path = self.cache_dir / thumbnail_filename
-            
-            # 检查文件是否存在
-            if thumbnail_path.exists():
-                return thumbnail_path
-            else:
-                self._log("warning", f"缩略图文件不存在: {thumbnail_path}")
+            cache_root = self.cache_dir.resolve()
+            thumbnail_path = (cache_root / file_name).resolve()
+            thumbnail_path.relative_to(cache_root)
+
+            stat_result = os.stat(thumbnail_path)
+            if stat_result.st_size == 0:
                 return None
-                
-        except Exception as e:
-            self._log("error", f"获取缩略图路径异常: {str(e)}")
+            return thumbnail_path, stat_result
+
+        except (ValueError, OSError):
             return None
 
-    def get_thumbnail_url_path(self, file_id: str) -> Optional[str]:
+    @staticmethod
+    def make_etag(stat_result: os.stat_result) -> str:
         """
-        获取缩略图的URL路径（用于前端访问）
+        由修改时间和文件大小生成ETag
         """
-        try:
-            thumbnail_path = self.get_thumbnail_path(file_id)
-            self._log("info", f"get_thumbnail_url_path 调用: file_id={file_id}, thumbnail_path={thumbnail_path}")
-            
-            if thumbnail_path and thumbnail_path.exists():
-                # 返回一个特殊的标记，告诉前端这个项目有缩略图
-                # 前端会在图片加载失败时尝试通过API获取缩略图
-                self._log("info", f"缩略图存在，标记为可用: {file_id}")
-                return "HAS_THUMBNAIL"
+        return ThumbnailManager._format_etag(stat_result.st_size, stat_result.st_mtime_ns)
+
+    @staticmethod
+    def _format_etag(size: int, mtime_ns: int) -> str:
+        return f'"{mtime_ns:x}-{size:x}"'
+
+    def get_mime_type(self, path: Path) -> str:
+        """
+        缩略图文件的MIME类型
+        """
+        return self.MIME_TYPES.get(path.suffix.lower(), "application/octet-stream")
+
+    def build_pack(self, file_ids: List[str], size: int = None, fmt: str = None,
+                   accept: str = "") -> Tuple[str, bytes]:
+        """
+        将多个缩略图打包为一个二进制块，返回(ETag, 打包内容)
+
+        格式: [4字节大端序索引长度][索引JSON][各缩略图内容依次拼接]
+        索引JSON: {"items": [{"file_id", "offset", "size", "mime_type", "etag"}], "missing": [file_id],
+                   "truncated": [file_id]}
+        超出PACK_MAX_ITEMS的file_id不打包，列入truncated供客户端分批重新请求；
+        offset相对于索引之后的数据区起点；ETag由集合内各文件的ETag计算，集合不变时命中缓存；
+        size/fmt/accept按select_variant的规则为每个file_id选择变体
+        """
+        entries = []
+        missing = []
+        digest = hashlib.sha1()
+
+        # 与清单使用相同的字符串键查找（接口传入的是字符串，上传流程得到的是数字fileID）
+        unique_ids = list(dict.fromkeys(normalize_file_id(file_id) for file_id in file_ids))
+        truncated = unique_ids[self.PACK_MAX_ITEMS:]
+
+        # 集合ETag由内存清单计算，缓存命中时无需访问文件系统
+        for file_id in unique_ids[:self.PACK_MAX_ITEMS]:
+            variants = self._manifest.get(file_id)
+            self.record_access(file_id, bool(variants))
+            if variants:
+                variant = self._choose_variant(variants, size, fmt, accept)
+                thumbnail_path = self.cache_dir / self.variant_file_name(file_id, variant)
+                file_etag = self._format_etag(*variants[variant])
+                entries.append((file_id, thumbnail_path, file_etag))
+                digest.update(f"{file_id}/{variant}:{file_etag};".encode("utf-8"))
             else:
-                self._log("warning", f"缩略图文件不存在: {thumbnail_path}")
-                return None
-                
-        except Exception as e:
-            self._log("error", f"获取缩略图URL路径异常: {str(e)}")
+                missing.append(file_id)
+                digest.update(f"{file_id}:-;".encode("utf-8"))
+
+        for file_id in truncated:
+            digest.update(f"{file_id}:truncated;".encode("utf-8"))
+
+        etag = f'"{digest.hexdigest()}"'
+
+        with self._pack_lock:
+            payload = self._pack_cache.get(etag)
+            if payload is not None:
+                self._pack_cache.move_to_end(etag)
+                return etag, payload
+
+        items = []
+        blobs = []
+        offset = 0
+        for file_id, thumbnail_path, file_etag in entries:
+            try:
+                with open(thumbnail_path, 'rb') as f:
+                    content = f.read()
+            except OSError:
+                # 文件已被外部删除，修正清单
+                self._manifest_discard(file_id)
+                missing.append(file_id)
+                continue
+
+            items.append({
+                "file_id": file_id,
+                "offset": offset,
+                "size": len(content),
+                "mime_type": self.get_mime_type(thumbnail_path),
+                "etag": file_etag
+            })
+            blobs.append(content)
+            offset += len(content)
+
+        index = json.dumps({"items": items, "missing": missing, "truncated": truncated},
+                           ensure_ascii=False).encode("utf-8")
+        payload = b"".join([struct.pack(">I", len(index)), index, *blobs])
+
+        self._cache_pack(etag, payload)
+        return etag, payload
+
+    def _cache_pack(self, etag: str, payload: bytes):
+        """
+        缓存打包结果，超出条目数或字节上限时淘汰最久未使用的条目
+        """
+        if len(payload) > self.PACK_CACHE_BYTES:
+            return
+
+        with self._pack_lock:
+            if etag in self._pack_cache:
+                return
+            self._pack_cache[etag] = payload
+            self._pack_cache_bytes += len(payload)
+
+            while (len(self._pack_cache) > self.PACK_CACHE_ENTRIES
+                   or self._pack_cache_bytes > self.PACK_CACHE_BYTES):
+                _, evicted = self._pack_cache.popitem(last=False)
+                self._pack_cache_bytes -= len(evicted)
+
+    @staticmethod
+    def unpack(payload: bytes) -> Tuple[Dict[str, Any], memoryview]:
+        """
+        解析build_pack生成的打包内容，返回(索引, 数据区)
+        """
+        index_length = struct.unpack_from(">I", payload)[0]
+        index = json.loads(payload[4:4 + index_length].decode("utf-8"))
+        return index, memoryview(payload)[4 + index_length:]
+
+    @classmethod
+    def variant_file_name(cls, file_id: str, variant: str) -> str:
+        """
+        变体对应的缓存文件名：默认变体为{file_id}.webp（兼容旧版），其余为{file_id}_{尺寸}.{格式}
+        """
+        if variant == cls.DEFAULT_VARIANT:
+            return f"{file_id}.webp"
+        size, fmt = variant.split(".")
+        return f"{file_id}_{size}.{fmt}"
+
+    def parse_file_name(self, file_name: str) -> Optional[Tuple[str, str]]:
+        """
+        解析缓存文件名，返回(file_id, 变体)；不是缩略图文件时返回None
+        """
+        stem, _, fmt = file_name.rpartition(".")
+        if not stem or fmt not in self.FORMAT_OPTIONS:
             return None
 
-    async def generate_thumbnail(self, image_url: str, file_id: str) -> Optional[Path]:
+        file_id, _, size = stem.rpartition("_")
+        if file_id and size.isdigit() and int(size) in self.variant_sizes:
+            return file_id, f"{int(size)}.{fmt}"
+        if fmt == "webp":
+            return stem, self.DEFAULT_VARIANT
+        return None
+
+    def select_variant(self, file_name: str, size: int = None, fmt: str = None, accept: str = "") -> str:
+        """
+        为请求选择实际提供的缓存文件名
+
+        请求默认文件名或指定了size/fmt时，在已有变体中选择：尺寸取不小于size的最小尺寸（默认200），
+        格式优先取fmt，其次在Accept包含image/avif时取AVIF，否则取WebP；
+        直接请求某个变体文件名且未指定参数时原样返回
+        """
+        parsed = self.parse_file_name(file_name)
+        if not parsed:
+            return file_name
+
+        file_id, variant = parsed
+        if variant != self.DEFAULT_VARIANT and not size and not fmt:
+            return file_name
+
+        variants = self._manifest.get(file_id)
+        if not variants:
+            return file_name
+        return self.variant_file_name(file_id, self._choose_variant(variants, size, fmt, accept))
+
+    def _choose_variant(self, variants: Dict[str, Tuple[int, int]], size: int = None,
+                        fmt: str = None, accept: str = "") -> str:
+        """
+        在已有变体中按尺寸和格式偏好选择一个
+        """
+        available_sizes = sorted({int(variant.split(".")[0]) for variant in variants})
+        wanted = size or self.DEFAULT_VARIANT_SIZE
+        larger = [available for available in available_sizes if available >= wanted]
+        chosen_size = larger[0] if larger else available_sizes[-1]
+
+        formats = [variant.split(".")[1] for variant in variants if variant.startswith(f"{chosen_size}.")]
+        fmt = (fmt or "").lower()
+        if fmt in formats:
+            chosen_format = fmt
+        elif "avif" in formats and "image/avif" in (accept or "").lower():
+            chosen_format = "avif"
+        elif "webp" in formats:
+            chosen_format = "webp"
+        else:
+            chosen_format = formats[0]
+
+        return f"{chosen_size}.{chosen_format}"
+
+    def get_thumbnail_path(self, file_id: str) -> Optional[Path]:
+        """
+        获取默认缩略图文件路径（查询内存清单，不访问文件系统）
+        """
+        if self.has_thumbnail(file_id):
+            return self.cache_dir / f"{file_id}.webp"
+        return None
+
+    def get_thumbnail_url_path(self, file_id: str) -> Optional[str]:
+        """
+        获取缩略图的URL路径（用于前端访问）
+        """
+        # 返回一个特殊的标记，告诉前端这个项目有缩略图
+        # 前端会在图片加载失败时尝试通过API获取缩略图
+        return "HAS_THUMBNAIL" if self.has_thumbnail(file_id) else None
+
+    async def generate_thumbnail(self, image_url: str, file_id: str, complete: bool = False) -> Optional[Path]:
         """
         生成缩略图
+
+        :param complete: 为True时，默认缩略图已存在但缺少其他变体也会重新生成（用于补齐旧版缓存）
         """
         try:
             self._log("info", f"开始生成缩略图: {file_id}")
             
             # 检查是否已存在
             existing_thumbnail = self.get_thumbnail_path(file_id)
-            if existing_thumbnail:
+            if existing_thumbnail and (not complete or self.has_all_variants(file_id)):
                 self._log("info", f"缩略图已存在，跳过生成: {file_id}")
                 return existing_thumbnail
+
+            # 上传时正在由本地文件生成，等待其结果即可，无需从CDN下载
+            inline_task = self._inline_tasks.get(file_id)
+            if inline_task is not None and inline_task.get_loop() is asyncio.get_running_loop():
+                thumbnail_path = await asyncio.shield(inline_task)
+                if thumbnail_path:
+                    return thumbnail_path
             
             # 下载图片
-            async with aiohttp.ClientSession() as session:
-                async with session.get(image_url) as response:
-                    if response.status != 200:
-                        self._log("error", f"下载图片失败，HTTP状态码: {response.status}")
-                        return None
-                    
-                    image_data = await response.read()
-                    
-                    # 生成缩略图
-                    thumbnail_path = await self._create_thumbnail(image_data, file_id)
-                    if thumbnail_path:
-                        self._log("info", f"缩略图生成成功: {file_id}")
-                        return thumbnail_path
-                    else:
-                        self._log("error", f"缩略图生成失败: {file_id}")
-                        return None
+            session = await self._http.get()
+            async with session.get(image_url) as response:
+                if response.status != 200:
+                    self._log("error", f"下载图片失败，HTTP状态码: {response.status}")
+                    return None
+
+                image_data = await response.read()
+
+            # 生成缩略图
+            thumbnail_path = await self._create_thumbnail(image_data, file_id)
+            if thumbnail_path:
+                self._log("info", f"缩略图生成成功: {file_id}")
+                return thumbnail_path
+            else:
+                self._log("error", f"缩略图生成失败: {file_id}")
+                return None
                         
         except Exception as e:
             self._log("error", f"生成缩略图异常: {str(e)}")
             return None
 
-    async def _create_thumbnail(self, image_data: bytes, file_id: str) -> Optional[Path]:
+    async def generate_from_file(self, file_path: str, file_id: str) -> Optional[Path]:
         """
-        创建缩略图文件
+        由本地图片文件（如上传时的临时文件）生成缩略图
         """
         try:
-            # 打开图片
-            img = Image.open(io.BytesIO(image_data))
-            
-            # 转换为RGB模式（如果需要）
-            if img.mode in ('RGBA', 'P', 'LA'):
-                # 创建白色背景
-                background = Image.new('RGB', img.size, (255, 255, 255))
-                # 如果图片有alpha通道，将其作为mask粘贴到背景上
-                if img.mode == 'RGBA':
-                    background.paste(img, mask=img.split()[-1])
-                else:
-                    background.paste(img)
-                img = background
-            
-            # 生成缩略图
-            img.thumbnail(self.thumbnail_size, Image.Resampling.LANCZOS)
+            thumbnail_path = await self._create_thumbnail(file_path, file_id)
+            if thumbnail_path:
+                self._log("info", f"由本地文件生成缩略图成功: {file_id}")
+            return thumbnail_path
+        except Exception as e:
+            self._log("error", f"由本地文件生成缩略图异常: {str(e)}")
+            return None
+
+    def schedule_from_file(self, file_path: str, file_id: str, on_done: Callable[[], None] = None):
+        """
+        在后台由本地文件生成缩略图，不阻塞调用方；完成后（无论成败）调用on_done释放文件
+        """
+        async def run():
+            try:
+                return await self.generate_from_file(file_path, file_id)
+            finally:
+                if self._inline_tasks.get(file_id) is task:
+                    del self._inline_tasks[file_id]
+                if on_done is not None:
+                    on_done()
+
+        task = asyncio.get_running_loop().create_task(run())
+        self._inline_tasks[file_id] = task
+        return task
+
+    async def _create_thumbnail(self, source: Union[bytes, str], file_id: str) -> Optional[Path]:
+        """
+        创建缩略图文件：渲染工作提交到专用执行器，协程只等待结果
+
+        :param source: 图片内容或本地图片文件路径
+        """
+        cost = self._estimate_render_cost(source)
+        return await self._executor.run(cost, self._render_thumbnail, source, file_id)
+
+    @staticmethod
+    def _open_source(source: Union[bytes, str]) -> Image.Image:
+        """
+        打开图片内容或本地图片文件（只解析文件头）
+        """
+        return Image.open(io.BytesIO(source) if isinstance(source, bytes) else source)
+
+    def _estimate_render_cost(self, source: Union[bytes, str]) -> int:
+        """
+        估算渲染所需内存：只读取图片头获得尺寸，按RGBA解码计算（JPEG按draft缩放后的尺寸计算）
+        """
+        try:
+            source_size = len(source) if isinstance(source, bytes) else os.path.getsize(source)
+            with self._open_source(source) as img:
+                width, height = img.size
+                is_jpeg = img.format == 'JPEG'
+
+            pixels = width * height
+            if is_jpeg:
+                ratio = self._downscale_ratio((width, height), self._largest_box())
+                scale = 1
+                while scale < 8 and ratio / 2 >= scale * 2:
+                    scale *= 2
+                pixels //= scale * scale
+
+            return pixels * 4 + source_size
+        except Exception:
+            return len(source) * 4 if isinstance(source, bytes) else 0
+
+    def _render_thumbnail(self, source: Union[bytes, str], file_id: str) -> Optional[Path]:
+        """
+        解码、缩放并保存全部缩略图变体（同步，运行于渲染执行器），返回默认变体的路径
+
+        只解码一次：按最大尺寸降采样解码后，从大到小逐级缩放，每个尺寸依次编码为各个格式
+        """
+        source_img = None
+        try:
+            # 打开图片（此时只解析文件头）
+            img = source_img = self._open_source(source)
             
-            # 保存缩略图
-            thumbnail_filename = f"{file_id}.webp"
-            thumbnail_path = self.cache_dir / thumbnail_filename
+            # 按最大变体尺寸降采样解码，避免按原始分辨率完整解码
+            img = self._decode_reduced(img)
             
-            img.save(
-                thumbnail_path, 
-                format=self.thumbnail_format,
-                quality=self.thumbnail_quality,
-                optimize=True
-            )
+            default_path = None
+            for size in sorted(self.variant_sizes, reverse=True):
+                # 在上一级的基础上缩放，滤镜根据剩余缩放比例选择
+                box = (size, size)
+                img.thumbnail(box, self._choose_resample(img.size, box))
+                flat = self._flatten(img)
+
+                for fmt in self.variant_formats:
+                    variant = f"{size}.{fmt}"
+                    try:
+                        thumbnail_path = self._save_variant(flat, file_id, variant)
+                    except Exception as e:
+                        if variant == self.DEFAULT_VARIANT:
+                            raise
+                        self._log("warning", f"保存缩略图变体失败 {file_id} {variant}: {str(e)}")
+                        continue
+                    if variant == self.DEFAULT_VARIANT:
+                        default_path = thumbnail_path
             
-            self._log("info", f"缩略图保存成功: {thumbnail_filename}")
-            return thumbnail_path
+            self._log("info", f"缩略图保存成功: {file_id}")
+            return default_path
             
         except Exception as e:
             self._log("error", f"创建缩略图文件异常: {str(e)}")
             return None
 
+        finally:
+            # 关闭源图片（由文件路径打开时会持有文件句柄）
+            if source_img is not None:
+                source_img.close()
+
+    @staticmethod
+    def _flatten(img: Image.Image) -> Image.Image:
+        """
+        透明通道与白色背景合成并转为RGB（在缩放后进行，只需处理缩略图大小的像素）
+        """
+        if img.mode == 'RGBA':
+            background = Image.new('RGB', img.size, (255, 255, 255))
+            background.paste(img, mask=img.split()[-1])
+            return background
+        if img.mode != 'RGB':
+            return img.convert('RGB')
+        return img
+
+    def _save_variant(self, img: Image.Image, file_id: str, variant: str) -> Path:
+        """
+        保存一个变体：先写临时文件再替换，读取方不会看到写了一半的文件
+        """
+        file_name = self.variant_file_name(file_id, variant)
+        thumbnail_path = self.cache_dir / file_name
+        temp_path = self.cache_dir / f".{file_name}.{threading.get_ident()}.tmp"
+
+        image_format, options = self.FORMAT_OPTIONS[variant.split(".")[1]]
+        try:
+            img.save(temp_path, format=image_format, **options)
+            os.replace(temp_path, thumbnail_path)
+        except Exception:
+            temp_path.unlink(missing_ok=True)
+            raise
+
+        self._manifest_put(file_id, variant, os.stat(thumbnail_path))
+        return thumbnail_path
+
+    def _decode_reduced(self, img: Image.Image) -> Image.Image:
+        """
+        降采样解码：JPEG使用draft()按1/2、1/4、1/8比例直接解码，
+        其他格式使用reduce()按整数倍缩小，两者都保留至少2倍于最大变体的尺寸供后续重采样
+        """
+        box = self._largest_box()
+
+        if img.format == 'JPEG':
+            # draft会选择不小于请求尺寸的最小DCT缩放比例
+            img.draft('RGB', (box[0] * 2, box[1] * 2))
+
+        # 调色板图片先转为RGBA/RGB，保证缩放时按真实颜色插值（reduce也不支持调色板模式）
+        if img.mode == 'P':
+            img = img.convert('RGBA' if 'transparency' in img.info else 'RGB')
+        elif img.mode == 'LA':
+            img = img.convert('RGBA')
+
+        factor = self._downscale_ratio(img.size, box) / 2
+        if factor >= 2:
+            try:
+                img = img.reduce(int(factor))
+            except ValueError:
+                # 部分模式不支持reduce，交给最终重采样处理
+                pass
+
+        return img
+
+    def _largest_box(self) -> Tuple[int, int]:
+        """
+        最大变体的尺寸框
+        """
+        largest = max(self.variant_sizes)
+        return largest, largest
+
+    @staticmethod
+    def _downscale_ratio(size: Tuple[int, int], box: Tuple[int, int]) -> float:
+        """
+        图片缩放到box（保持宽高比）所需的缩小倍数
+        """
+        width, height = size
+        target_width, target_height = box
+        return max(width / target_width, height / target_height, 1.0)
+
+    def _choose_resample(self, size: Tuple[int, int], box: Tuple[int, int]):
+        """
+        根据缩小倍数选择重采样滤镜：倍数小时用LANCZOS保证锐度，倍数大时用开销更小的滤镜
+        """
+        ratio = self._downscale_ratio(size, box)
+        for max_ratio, resample in self.RESAMPLE_BY_RATIO:
+            if ratio <= max_ratio:
+                return resample
+        return self.RESAMPLE_BY_RATIO[-1][1]
+
+    def has_thumbnail(self, file_id: str) -> bool:
+        """
+        默认缩略图是否已存在（查询内存清单）
+        """
+        return self.DEFAULT_VARIANT in self._manifest.get(normalize_file_id(file_id), ())
+
+    def has_all_variants(self, file_id: str) -> bool:
+        """
+        全部尺寸和格式的变体是否都已存在
+        """
+        variants = self._manifest.get(normalize_file_id(file_id), ())
+        return all(f"{size}.{fmt}" in variants for size in self.variant_sizes for fmt in self.variant_formats)
+
+    def _load_manifest(self):
+        """
+        启动时扫描缓存目录，建立 file_id -> {变体: (文件大小, 修改时间ns)} 清单；
+        初始的LRU顺序按修改时间从旧到新排列
+        """
+        found = []
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                for entry in entries:
+                    parsed = self.parse_file_name(entry.name) if entry.is_file() else None
+                    if not parsed:
+                        continue
+                    stat_result = entry.stat()
+                    if stat_result.st_size > 0:
+                        found.append((*parsed, stat_result.st_size, stat_result.st_mtime_ns))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            self._log("error", f"扫描缩略图缓存目录异常: {str(e)}")
+
+        manifest = OrderedDict()
+        for file_id, variant, size, mtime_ns in sorted(found, key=lambda item: item[3]):
+            manifest.setdefault(file_id, {})[variant] = (size, mtime_ns)
+            manifest.move_to_end(file_id)
+
+        with self._manifest_lock:
+            self._manifest = manifest
+            self._manifest_bytes = sum(item[2] for item in found)
+        self._log("info", f"缩略图清单加载完成，共 {len(manifest)} 个，{len(found)} 个文件")
+        self._schedule_eviction()
+
+    def _manifest_put(self, file_id: str, variant: str, stat_result: os.stat_result):
+        """
+        写入缩略图变体后更新清单（视为最近使用），超出容量上限时安排后台淘汰
+
+        变体字典按写时复制替换而不原地修改，请求线程不加锁读取时只会拿到完整的快照；
+        清单的键统一为字符串（启动扫描得到的file_id来自文件名）
+        """
+        file_id = normalize_file_id(file_id)
+        with self._manifest_lock:
+            variants = dict(self._manifest.get(file_id) or {})
+            previous = variants.get(variant)
+            if previous:
+                self._manifest_bytes -= previous[0]
+            variants[variant] = (stat_result.st_size, stat_result.st_mtime_ns)
+            self._manifest[file_id] = variants
+            self._manifest.move_to_end(file_id)
+            self._manifest_bytes += stat_result.st_size
+        self._schedule_eviction()
+
+    def _manifest_discard(self, file_id: str) -> Dict[str, Tuple[int, int]]:
+        """
+        删除缩略图后更新清单，返回被移除的变体
+        """
+        file_id = normalize_file_id(file_id)
+        with self._manifest_lock:
+            variants = self._manifest.pop(file_id, None) or {}
+            self._manifest_bytes -= sum(size for size, _ in variants.values())
+        return variants
+
+    def record_access(self, file_id: str, hit: bool):
+        """
+        记录一次缩略图访问：命中时将其移到LRU末尾（最近使用）
+        """
+        file_id = normalize_file_id(file_id)
+        with self._manifest_lock:
+            if hit and file_id in self._manifest:
+                self._manifest.move_to_end(file_id)
+                self._hits += 1
+            else:
+                self._misses += 1
+
+    def set_cache_limits(self, max_bytes: int = 0, max_entries: int = 0):
+        """
+        设置缓存容量上限（0表示不限制），立即按新上限检查一次
+        """
+        self.cache_max_bytes = max(0, int(max_bytes or 0))
+        self.cache_max_entries = max(0, int(max_entries or 0))
+        self._schedule_eviction()
+
+    def _over_limit(self, ratio: float = 1.0) -> bool:
+        """
+        清单是否超出容量上限（ratio用于计算淘汰的目标水位）
+        """
+        if self.cache_max_bytes and self._manifest_bytes > self.cache_max_bytes * ratio:
+            return True
+        if self.cache_max_entries and len(self._manifest) > self.cache_max_entries * ratio:
+            return True
+        return False
+
+    def _schedule_eviction(self):
+        """
+        超出容量上限时安排一次后台淘汰，短时间内的多次写入只触发一次
+        """
+        with self._manifest_lock:
+            if self._evict_timer is not None or not self._over_limit():
+                return
+            self._evict_timer = threading.Timer(self.EVICT_DELAY, self.evict)
+            self._evict_timer.daemon = True
+            self._evict_timer.start()
+
+    def evict(self) -> int:
+        """
+        按LRU顺序淘汰缩略图，直到低于上限的EVICT_TARGET_RATIO，返回淘汰数量
+        """
+        with self._manifest_lock:
+            self._evict_timer = None
+            if not self._over_limit():
+                return 0
+
+            victims = []
+            while self._manifest and self._over_limit(self.EVICT_TARGET_RATIO):
+                file_id, variants = self._manifest.popitem(last=False)
+                self._manifest_bytes -= sum(size for size, _ in variants.values())
+                victims.append((file_id, variants))
+
+        evicted = 0
+        for file_id, variants in victims:
+            for variant, (size, _) in variants.items():
+                try:
+                    (self.cache_dir / self.variant_file_name(file_id, variant)).unlink()
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    self._log("warning", f"淘汰缩略图失败 {file_id} {variant}: {str(e)}")
+                    continue
+                self._evicted_bytes += size
+            evicted += 1
+            self._evictions += 1
+
+        if evicted:
+            self._log("info", f"缩略图缓存超出上限，已淘汰 {evicted} 个最久未使用的缩略图")
+        return evicted
+
+    def _unlink_thumbnail(self, file_id: str) -> bool:
+        """
+        删除缩略图的全部变体文件并同步清单，没有任何文件被删除时返回False
+        """
+        variants = set(self._manifest_discard(file_id)) | {self.DEFAULT_VARIANT}
+        removed = False
+        for variant in variants:
+            try:
+                (self.cache_dir / self.variant_file_name(file_id, variant)).unlink()
+                removed = True
+            except FileNotFoundError:
+                pass
+        return removed
+
+    async def generate_batch(self, items: List[Tuple[str, str]],
+                             job: ThumbnailBatchJob = None) -> ThumbnailBatchJob:
+        """
+        并发生成一批缩略图
+
+        :param items: (file_id, 图片URL)列表
+        :param job: 用于记录进度的任务对象，不提供时新建
+        """
+        if job is None:
+            job = ThumbnailBatchJob(len(items), self.concurrency)
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def worker(file_id: str, image_url: str):
+            if not file_id or not image_url:
+                job.failed += 1
+                return
+            if self.has_all_variants(file_id):
+                job.skipped += 1
+                return
+
+            async with semaphore:
+                thumbnail_path = await self.generate_thumbnail(image_url, file_id, complete=True)
+
+            if thumbnail_path:
+                job.generated += 1
+            else:
+                job.failed += 1
+                job.failed_ids.append(file_id)
+
+        try:
+            self._log("info", f"开始批量生成缩略图，共 {job.total} 个，并发数: {self.concurrency}")
+            await asyncio.gather(*(worker(file_id, image_url) for file_id, image_url in items))
+        except asyncio.CancelledError:
+            job.cancelled = True
+            raise
+        finally:
+            job.running = False
+            job.finished_at = time.time()
+            self._log("info", f"批量生成缩略图结束：成功 {job.generated} 个，跳过 {job.skipped} 个，"
+                              f"失败 {job.failed} 个，耗时 {job.finished_at - job.started_at:.1f}s")
+
+        return job
+
+    def start_batch(self, items: List[Tuple[str, str]]) -> Dict[str, Any]:
+        """
+        在后台启动批量生成任务，已有任务运行时直接返回其进度
+        """
+        if self._batch_job is not None and self._batch_job.running:
+            return self._batch_job.to_dict()
+
+        job = ThumbnailBatchJob(len(items), self.concurrency)
+        self._batch_job = job
+        self._batch_task = asyncio.get_running_loop().create_task(self.generate_batch(items, job))
+        return job.to_dict()
+
+    def get_batch_status(self) -> Optional[Dict[str, Any]]:
+        """
+        获取当前（或最近一次）批量生成任务的进度
+        """
+        return self._batch_job.to_dict() if self._batch_job is not None else None
+
+    def close(self):
+        """
+        取消后台任务并释放HTTP会话和线程池
+        """
+        try:
+            with self._manifest_lock:
+                if self._evict_timer is not None:
+                    self._evict_timer.cancel()
+                    self._evict_timer = None
+            for task in [self._batch_task, *self._inline_tasks.values()]:
+                if task is not None and not task.done():
+                    task.get_loop().call_soon_threadsafe(task.cancel)
+            self._http.close()
+            self._executor.shutdown()
+        except Exception as e:
+            self._log("error", f"关闭缩略图管理器异常: {str(e)}")
+
     def delete_thumbnail(self, file_id: str) -> bool:
         """
         删除缩略图
         """
         try:
-            thumbnail_path = self.get_thumbnail_path(file_id)
-            if thumbnail_path and thumbnail_path.exists():
-                thumbnail_path.unlink()
+            if self._unlink_thumbnail(file_id):
                 self._log("info", f"缩略图删除成功: {file_id}")
                 return True
             else:
@@ -182,14 +897,45 @@ class ThumbnailManager:
             self._log("error", f"删除缩略图异常: {str(e)}")
             return False
 
+    async def delete_thumbnails(self, file_ids: List[str]) -> Dict[str, bool]:
+        """
+        批量删除缩略图，各文件的删除在线程池中并行执行
+
+        :return: file_id -> 是否删除了缩略图文件
+        """
+        unique_ids = list(dict.fromkeys(file_id for file_id in file_ids if file_id))
+        if not unique_ids:
+            return {}
+
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *(loop.run_in_executor(None, self._unlink_thumbnail, file_id) for file_id in unique_ids),
+            return_exceptions=True
+        )
+
+        outcomes = {}
+        for file_id, result in zip(unique_ids, results):
+            if isinstance(result, Exception):
+                self._log("error", f"删除缩略图异常 {file_id}: {str(result)}")
+                outcomes[file_id] = False
+            else:
+                outcomes[file_id] = bool(result)
+
+        self._log("info", f"批量删除缩略图完成: {sum(outcomes.values())}/{len(unique_ids)}")
+        return outcomes
+
     def cleanup_all_thumbnails(self) -> bool:
         """
         清理所有缩略图
         """
         try:
             if self.cache_dir.exists():
-                for thumbnail_file in self.cache_dir.glob("*.webp"):
-                    thumbnail_file.unlink()
+                for fmt in self.FORMAT_OPTIONS:
+                    for thumbnail_file in self.cache_dir.glob(f"*.{fmt}"):
+                        thumbnail_file.unlink()
+                with self._manifest_lock:
+                    self._manifest.clear()
+                    self._manifest_bytes = 0
                 
                 self._log("info", "所有缩略图清理完成")
                 return True
@@ -203,25 +949,30 @@ class ThumbnailManager:
 
     def get_cache_info(self) -> dict:
         """
-        获取缓存信息
+        获取缓存信息（由内存清单统计），包括容量上限和命中、未命中、淘汰计数
         """
         try:
-            if not self.cache_dir.exists():
-                return {
-                    "total_count": 0,
-                    "total_size": 0,
-                    "cache_dir": str(self.cache_dir),
-                    "exists": False
-                }
-            
-            thumbnail_files = list(self.cache_dir.glob("*.webp"))
-            total_size = sum(f.stat().st_size for f in thumbnail_files)
+            with self._manifest_lock:
+                total_count = len(self._manifest)
+                file_count = sum(len(variants) for variants in self._manifest.values())
+                total_size = self._manifest_bytes
+                hits, misses = self._hits, self._misses
             
             return {
-                "total_count": len(thumbnail_files),
+                "total_count": total_count,
+                "file_count": file_count,
                 "total_size": total_size,
+                "variant_sizes": list(self.variant_sizes),
+                "variant_formats": list(self.variant_formats),
+                "max_size": self.cache_max_bytes,
+                "max_count": self.cache_max_entries,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+                "evictions": self._evictions,
+                "evicted_size": self._evicted_bytes,
                 "cache_dir": str(self.cache_dir),
-                "exists": True
+                "exists": self.cache_dir.exists()
             }
             
         except Exception as e:
@@ -238,14 +989,13 @@ class ThumbnailManager:
         清理孤立的缩略图（没有对应历史记录的缩略图）
         """
         try:
-            if not self.cache_dir.exists():
-                return 0
+            active = {normalize_file_id(file_id) for file_id in active_file_ids}
+            with self._manifest_lock:
+                orphaned = [file_id for file_id in self._manifest if file_id not in active]
             
             cleaned_count = 0
-            for thumbnail_file in self.cache_dir.glob("*.webp"):
-                file_id = thumbnail_file.stem
-                if file_id not in active_file_ids:
-                    thumbnail_file.unlink()
+            for file_id in orphaned:
+                if self._unlink_thumbnail(file_id):
                     cleaned_count += 1
                     self._log("info", f"清理孤立缩略图: {file_id}")
             
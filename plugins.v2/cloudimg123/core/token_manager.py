@@ -1,8 +1,11 @@
 import json
+import os
+import tempfile
+import threading
 import time
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 
 from app.core.config import settings
 from app.log import logger
@@ -21,6 +24,11 @@ class TokenManager:
         self.token_validity_days = 30
         # 提前更新时间：提前1天更新token
         self.refresh_buffer_days = 1
+
+        # 内存中的token数据及其对应的文件修改时间，文件未变化时不再读取
+        self._cache: Dict[str, Any] = {}
+        self._cache_mtime_ns: Optional[int] = None
+        self._cache_lock = threading.Lock()
         
         # 确保配置目录存在
         if not self.config_path.exists():
@@ -41,15 +49,29 @@ class TokenManager:
 
     def _load_token_data(self) -> Dict[str, Any]:
         """
-        从文件加载token数据
+        获取token数据：文件修改时间未变化时直接返回内存中的副本，否则重新读取文件
         """
         try:
-            if not self.token_file.exists():
+            try:
+                mtime_ns = self.token_file.stat().st_mtime_ns
+            except FileNotFoundError:
+                with self._cache_lock:
+                    self._cache = {}
+                    self._cache_mtime_ns = None
                 return {}
-            
+
+            with self._cache_lock:
+                if self._cache_mtime_ns == mtime_ns:
+                    return dict(self._cache)
+
             with open(self.token_file, 'r', encoding='utf-8') as f:
                 data = json.load(f)
-                return data if isinstance(data, dict) else {}
+            data = data if isinstance(data, dict) else {}
+
+            with self._cache_lock:
+                self._cache = data
+                self._cache_mtime_ns = mtime_ns
+            return dict(data)
                 
         except Exception as e:
             logger.error(f"[CloudImg123-Token] 加载token数据失败: {str(e)}")
@@ -57,17 +79,34 @@ class TokenManager:
 
     def _save_token_data(self, token_data: Dict[str, Any]) -> bool:
         """
-        保存token数据到文件
+        保存token数据到文件（先写临时文件再原子替换，读取方不会看到写了一半的文件）
         """
+        temp_path = None
         try:
-            with open(self.token_file, 'w', encoding='utf-8') as f:
+            fd, temp_path = tempfile.mkstemp(prefix=".token_data.", suffix=".tmp", dir=str(self.config_path))
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
                 json.dump(token_data, f, ensure_ascii=False, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.token_file)
+            temp_path = None
+
+            with self._cache_lock:
+                self._cache = dict(token_data)
+                self._cache_mtime_ns = self.token_file.stat().st_mtime_ns
             return True
             
         except Exception as e:
             logger.error(f"[CloudImg123-Token] 保存token数据失败: {str(e)}")
             return False
 
+        finally:
+            if temp_path is not None:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+
     def get_stored_token(self) -> Optional[str]:
         """
         获取存储的有效token
@@ -205,11 +244,45 @@ class TokenManager:
             logger.error(f"[CloudImg123-Token] 检查token刷新需求异常: {str(e)}")
             return True
 
+    def get_token_deadlines(self) -> Optional[Tuple[str, float, float]]:
+        """
+        获取存储的未过期token及其时间节点
+
+        :return: (token, 建议刷新的时间戳, 过期时间戳)，没有未过期的token时返回None
+        """
+        try:
+            token_data = self._load_token_data()
+            access_token = token_data.get("access_token")
+            created_time = token_data.get("created_time")
+            if not access_token or not created_time:
+                return None
+
+            refresh_at, expires_at = self.deadlines_for(float(created_time))
+            if time.time() >= expires_at:
+                return None
+            return access_token, refresh_at, expires_at
+
+        except Exception as e:
+            logger.error(f"[CloudImg123-Token] 获取token时间节点异常: {str(e)}")
+            return None
+
+    def deadlines_for(self, created_time: float) -> Tuple[float, float]:
+        """
+        按创建时间计算token的建议刷新时间戳和过期时间戳
+        """
+        refresh_at = created_time + (self.token_validity_days - self.refresh_buffer_days) * 24 * 3600
+        expires_at = created_time + self.token_validity_days * 24 * 3600
+        return refresh_at, expires_at
+
     def clear_token(self) -> bool:
         """
         清除存储的token
         """
         try:
+            with self._cache_lock:
+                self._cache = {}
+                self._cache_mtime_ns = None
+
             if self.token_file.exists():
                 self.token_file.unlink()
                 logger.info(f"[CloudImg123-Token] token数据已清除")
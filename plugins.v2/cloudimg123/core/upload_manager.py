@@ -2,11 +2,13 @@ import asyncio
 import os
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 from app.log import logger
 from .api_client import CloudAPI123
 from .history_manager import HistoryManager, UploadRecord
+from .ingest import SpooledUpload
+from .utils import normalize_file_id
 
 
 class UploadManager:
@@ -14,9 +16,11 @@ class UploadManager:
     上传管理器
     """
     
-    def __init__(self, api_client: CloudAPI123, history_manager: HistoryManager):
+    def __init__(self, api_client: CloudAPI123, history_manager: HistoryManager, upload_concurrency: int = 3):
         self.api_client = api_client
         self.history_manager = history_manager
+        # 批量上传时同时上传的文件数
+        self.upload_concurrency = max(1, upload_concurrency)
         
         # 支持的图片格式
         self.supported_formats = {
@@ -47,11 +51,15 @@ class UploadManager:
             logger.error(f"[CloudImg123-Upload] 检查文件格式异常: {str(e)}")
             return False
 
-    def _validate_file(self, file_path: str) -> Dict[str, Any]:
+    def _validate_file(self, file_path: str, spool: SpooledUpload = None) -> Dict[str, Any]:
         """
         验证文件是否可以上传
         """
         try:
+            # 已在接收时得到大小和文件头，无需再访问磁盘
+            if spool is not None:
+                return self._validate_spooled(file_path, spool)
+
             # 检查文件是否存在
             if not os.path.exists(file_path):
                 return {"valid": False, "message": "文件不存在"}
@@ -83,58 +91,69 @@ class UploadManager:
             logger.error(f"[CloudImg123-Upload] 文件验证异常: {str(e)}")
             return {"valid": False, "message": f"文件验证异常: {str(e)}"}
 
-    def _generate_formats(self, download_url: str, filename: str) -> Dict[str, str]:
+    def _validate_spooled(self, file_path: str, spool: SpooledUpload) -> Dict[str, Any]:
         """
-        生成各种格式的链接
+        验证已接收的上传文件
         """
-        try:
-            # 获取不带扩展名的文件名作为alt文本
-            alt_text = Path(filename).stem
-            
-            formats = {
-                "url": download_url,
-                "html": f'<img src="{download_url}" alt="{alt_text}" title="{filename}">',
-                "markdown": f'![{alt_text}]({download_url} "{filename}")',
-                "bbcode": f'[img]{download_url}[/img]'
-            }
-            
-            logger.info(f"[CloudImg123-Upload] 生成链接格式完成: {filename}")
-            return formats
-            
-        except Exception as e:
-            logger.error(f"[CloudImg123-Upload] 生成链接格式异常: {str(e)}")
-            return {
-                "url": download_url,
-                "html": f'<img src="{download_url}" alt="{filename}">',
-                "markdown": f'![{filename}]({download_url})',
-                "bbcode": f'[img]{download_url}[/img]'
-            }
+        max_size = 100 * 1024 * 1024  # 100MB
+        if spool.size > max_size:
+            return {"valid": False, "message": f"文件过大，最大支持 {max_size // (1024*1024)}MB"}
+
+        if spool.size == 0:
+            return {"valid": False, "message": "文件为空"}
+
+        if not self._is_image_file(file_path):
+            return {"valid": False, "message": "不支持的文件格式，仅支持图片文件"}
+
+        # 文件头无法识别时（如XML声明或注释较长的SVG）按扩展名接受，格式取扩展名
+        if not spool.image_type:
+            spool.image_type = os.path.splitext(file_path)[1].lower().lstrip('.') or None
+
+        return {"valid": True, "size": spool.size}
+
+    def check_duplicate(self, file_hash: str = None, etag: str = None,
+                        filename: str = None) -> Optional[Dict[str, Any]]:
+        """
+        通过内容哈希索引检查重复上传，命中时将记录置顶并返回重复结果，否则返回None
+        """
+        duplicate_record = self.history_manager.find_duplicate(file_hash=file_hash, etag=etag)
+        if not duplicate_record:
+            return None
+
+        logger.info(f"[CloudImg123-Upload] 检测到重复文件，返回历史记录: {filename or duplicate_record.filename}")
+
+        # 将重复记录移至最前面
+        self.history_manager.move_record_to_front(duplicate_record.id)
+
+        return {
+            "success": True,
+            "message": "文件已存在，返回历史记录",
+            "is_duplicate": True,
+            "data": duplicate_record.to_dict(self.history_manager.link_formatter)
+        }
 
-    async def upload_image(self, file_path: str, filename: str = None, file_hash: str = None) -> Dict[str, Any]:
+    async def upload_image(self, file_path: str, filename: str = None, file_hash: str = None,
+                           spool: SpooledUpload = None) -> Dict[str, Any]:
         """
         增强的上传方法，支持哈希检测
+
+        :param spool: 接收请求时已生成的临时文件信息（含MD5），提供时复用其结果避免重复读取文件
         """
         try:
             logger.info(f"[CloudImg123-Upload] 开始处理上传请求: {file_path}")
+
+            # 前端的file_hash即文件MD5，未提供时使用接收时计算的MD5
+            if not file_hash and spool is not None:
+                file_hash = spool.md5_hex
             
             # 检查重复上传（基于哈希值）
             if file_hash:
-                duplicate_record = self.history_manager.get_record_by_hash(file_hash)
-                if duplicate_record:
-                    logger.info(f"[CloudImg123-Upload] 检测到重复文件，返回历史记录: {filename}")
-                    
-                    # 将重复记录移至最前面
-                    self.history_manager.move_record_to_front(duplicate_record.id)
-                    
-                    return {
-                        "success": True,
-                        "message": "文件已存在，返回历史记录",
-                        "is_duplicate": True,
-                        "data": duplicate_record.to_dict()
-                    }
+                duplicate = self.check_duplicate(file_hash=file_hash, filename=filename)
+                if duplicate:
+                    return duplicate
             
             # 验证文件
-            validation = self._validate_file(file_path)
+            validation = self._validate_file(file_path, spool)
             if not validation["valid"]:
                 logger.error(f"[CloudImg123-Upload] 文件验证失败: {validation['message']}")
                 return {"success": False, "message": validation["message"]}
@@ -143,17 +162,30 @@ class UploadManager:
             if not filename:
                 filename = os.path.basename(file_path)
             
+            # 文件内容MD5（即123云盘etag），调用创建接口前再按etag去重
+            if spool is not None:
+                etag = spool.md5_hex
+            else:
+                etag = await asyncio.get_running_loop().run_in_executor(
+                    None, self.api_client._calc_md5, file_path
+                )
+            if etag != file_hash:
+                duplicate = self.check_duplicate(etag=etag, filename=filename)
+                if duplicate:
+                    return duplicate
+
             logger.info(f"[CloudImg123-Upload] 开始上传文件: {filename}，大小: {validation['size']} bytes")
 
             # 调用API上传
-            upload_result = await self.api_client.upload_file(file_path, filename)
+            upload_result = await self.api_client.upload_file(file_path, filename, file_md5=etag)
             
             if not upload_result.get("success"):
                 logger.error(f"[CloudImg123-Upload] API上传失败: {upload_result.get('message')}")
                 return upload_result
 
             # 提取上传结果
-            file_id = upload_result.get("file_id")
+            # 123云盘返回数字fileID，统一为字符串，与历史记录和缩略图缓存的键一致
+            file_id = normalize_file_id(upload_result.get("file_id"))
             download_url = upload_result.get("download_url")
             user_self_url = upload_result.get("user_self_url")
             file_size = upload_result.get("size", validation["size"])
@@ -163,9 +195,6 @@ class UploadManager:
                 logger.error(f"[CloudImg123-Upload] 上传成功但未获取到下载链接")
                 return {"success": False, "message": "上传成功但未获取到下载链接"}
 
-            # 生成各种格式链接
-            formats = self._generate_formats(download_url, filename)
-
             # 创建上传记录（包含哈希值）
             record = UploadRecord(
                 filename=filename,
@@ -174,8 +203,8 @@ class UploadManager:
                 user_self_url=user_self_url,
                 file_size=file_size,
                 upload_time=upload_time_str or datetime.now().isoformat(),
-                formats=formats,
-                file_hash=file_hash  # 保存哈希值
+                file_hash=file_hash,  # 保存哈希值
+                etag=etag
             )
 
             # 保存到历史记录（使用新的增强方法）
@@ -183,6 +212,10 @@ class UploadManager:
             if not save_success:
                 logger.warning(f"[CloudImg123-Upload] 上传成功但保存历史记录失败: {filename}")
 
+            # 由本地临时文件在后台生成缩略图，避免之后再从CDN下载原图
+            if spool is not None and file_id:
+                self._schedule_inline_thumbnail(spool, file_id)
+
             logger.info(f"[CloudImg123-Upload] 文件上传完成: {filename}")
             
             # 返回完整结果
@@ -195,11 +228,13 @@ class UploadManager:
                     "filename": filename,
                     "file_id": file_id,
                     "file_hash": file_hash,
+                    "etag": etag,
                     "download_url": download_url,
                     "user_self_url": user_self_url,
                     "file_size": file_size,
                     "upload_time": record.upload_time,
-                    "formats": formats
+                    # 各种格式链接按模板即时生成
+                    "formats": record.get_formats(self.history_manager.link_formatter)
                 }
             }
             
@@ -209,41 +244,92 @@ class UploadManager:
             logger.error(f"[CloudImg123-Upload] 上传图片异常: {str(e)}")
             return {"success": False, "message": f"上传异常: {str(e)}"}
 
-    async def upload_multiple_images(self, file_paths: list, callback=None) -> Dict[str, Any]:
+    def _schedule_inline_thumbnail(self, spool: SpooledUpload, file_id: str):
+        """
+        持有临时文件的引用并在后台生成缩略图，生成结束后释放引用
+        """
+        # Pillow无法渲染SVG
+        if spool.image_type == 'svg':
+            return
+
+        thumbnail_manager = self.history_manager.thumbnail_manager
+        if thumbnail_manager.has_thumbnail(file_id):
+            return
+
+        spool.retain()
+        try:
+            thumbnail_manager.schedule_from_file(spool.path, file_id, on_done=spool.release)
+        except Exception as e:
+            spool.release()
+            logger.warning(f"[CloudImg123-Upload] 启动缩略图生成失败: {str(e)}")
+
+    async def upload_multiple_images(self, file_paths: list, callback=None,
+                                     concurrency: int = None) -> Dict[str, Any]:
         """
         批量上传多个图片
+
+        最多concurrency个文件同时上传（缺省为upload_concurrency），结果按传入顺序排列
+
+        :param file_paths: 文件路径列表；元素也可以是包含file_path及可选filename、file_hash、spool的字典
+        :param callback: 每个文件完成时调用callback(progress, result)，progress为整体完成百分比，
+                         result中的index为该文件在file_paths中的位置；callback可以是协程函数
+        :param concurrency: 同时上传的文件数
         """
         try:
-            results = []
-            success_count = 0
+            total = len(file_paths)
+            results: List[Optional[Dict[str, Any]]] = [None] * total
+            workers = max(1, min(int(concurrency or self.upload_concurrency), total or 1))
+            completed = 0
             
-            logger.info(f"[CloudImg123-Upload] 开始批量上传，文件数量: {len(file_paths)}")
-            
-            for i, file_path in enumerate(file_paths):
-                try:
-                    result = await self.upload_image(file_path)
-                    results.append(result)
-                    
-                    if result.get("success"):
-                        success_count += 1
-                    
+            logger.info(f"[CloudImg123-Upload] 开始批量上传，文件数量: {total}，并发数: {workers}")
+
+            # 预先获取访问令牌，并发任务直接复用缓存的令牌
+            if total:
+                await self.api_client.get_access_token()
+
+            queue: asyncio.Queue = asyncio.Queue()
+            for index, item in enumerate(file_paths):
+                queue.put_nowait((index, item if isinstance(item, dict) else {"file_path": item}))
+
+            async def worker():
+                nonlocal completed
+                while True:
+                    try:
+                        index, item = queue.get_nowait()
+                    except asyncio.QueueEmpty:
+                        return
+
+                    file_path = item.get("file_path")
+                    try:
+                        result = await self.upload_image(file_path, item.get("filename"),
+                                                         item.get("file_hash"), spool=item.get("spool"))
+                    except Exception as e:
+                        logger.error(f"[CloudImg123-Upload] 批量上传中单个文件失败: {file_path}, {str(e)}")
+                        result = {"success": False, "message": f"上传异常: {str(e)}", "file_path": file_path}
+
+                    result["index"] = index
+                    results[index] = result
+                    completed += 1
+
                     # 调用回调函数报告进度
                     if callback:
-                        progress = (i + 1) / len(file_paths) * 100
-                        callback(progress, result)
-                        
-                except Exception as e:
-                    error_result = {"success": False, "message": f"上传异常: {str(e)}", "file_path": file_path}
-                    results.append(error_result)
-                    logger.error(f"[CloudImg123-Upload] 批量上传中单个文件失败: {file_path}, {str(e)}")
-
-            logger.info(f"[CloudImg123-Upload] 批量上传完成，成功: {success_count}/{len(file_paths)}")
+                        try:
+                            ret = callback(completed / total * 100, result)
+                            if asyncio.iscoroutine(ret):
+                                await ret
+                        except Exception as e:
+                            logger.warning(f"[CloudImg123-Upload] 批量上传进度回调异常: {str(e)}")
+
+            await asyncio.gather(*(worker() for _ in range(workers)))
+
+            success_count = sum(1 for result in results if result and result.get("success"))
+            logger.info(f"[CloudImg123-Upload] 批量上传完成，成功: {success_count}/{total}")
             
             return {
                 "success": True,
-                "message": f"批量上传完成，成功 {success_count}/{len(file_paths)} 个文件",
+                "message": f"批量上传完成，成功 {success_count}/{total} 个文件",
                 "data": {
-                    "total": len(file_paths),
+                    "total": total,
                     "success_count": success_count,
                     "results": results
                 }
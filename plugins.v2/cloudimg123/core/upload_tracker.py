@@ -0,0 +1,191 @@
+"""
+异步上传完成跟踪
+由单个调度任务轮询所有等待中的异步上传，按指数退避和随机抖动安排各自的查询时间
+"""
+
+import asyncio
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from app.log import logger
+
+
+class AsyncUploadTracker:
+    """
+    异步上传完成跟踪器
+
+    每个preuploadID对应一个等待中的future，调度任务只在到期时查询对应的上传，
+    查询间隔从initial_delay开始按factor倍增至max_delay，并叠加±jitter比例的随机抖动；
+    同一preuploadID的多个等待方共享一次查询
+    """
+
+    def __init__(self, query: Callable[[str], Awaitable[Dict[str, Any]]],
+                 initial_delay: float = 1.0, max_delay: float = 15.0, factor: float = 2.0,
+                 jitter: float = 0.2, timeout: float = 300):
+        """
+        :param query: 查询单个上传状态的协程函数，返回{"completed": bool, "file_id": str}；
+                      返回{"success": False, "message": str}表示上传失败；抛出异常视为临时错误，按退避重试
+        :param timeout: 单个上传的最长等待时间（秒）
+        """
+        self.query = query
+        self.initial_delay = initial_delay
+        self.max_delay = max_delay
+        self.factor = factor
+        self.jitter = jitter
+        self.timeout = timeout
+
+        # preuploadID -> {"future", "waiters", "delay", "next_at", "deadline"}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def _jittered(self, delay: float) -> float:
+        """
+        为间隔叠加随机抖动，避免大量上传在同一时刻集中查询
+        """
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def _bind_loop(self):
+        """
+        绑定到当前事件循环；切换到其他事件循环时丢弃旧循环上的等待状态
+        """
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+
+        for entry in self._pending.values():
+            if not entry["future"].done():
+                entry["future"].cancel()
+        self._pending = {}
+        self._loop = loop
+        self._task = None
+        self._wakeup = asyncio.Event()
+
+    async def wait(self, preupload_id: str) -> Dict[str, Any]:
+        """
+        等待指定上传完成
+
+        :return: 成功时为{"success": True, "file_id": str}，失败或超时为{"success": False, "message": str}
+        """
+        self._bind_loop()
+
+        entry = self._pending.get(preupload_id)
+        if entry is None:
+            now = time.monotonic()
+            entry = {
+                "future": self._loop.create_future(),
+                "waiters": 0,
+                "delay": self.initial_delay,
+                "next_at": now + self._jittered(self.initial_delay),
+                "deadline": now + self.timeout
+            }
+            self._pending[preupload_id] = entry
+            self._wakeup.set()
+
+        if self._task is None or self._task.done():
+            self._task = self._loop.create_task(self._run())
+
+        entry["waiters"] += 1
+        try:
+            return await asyncio.shield(entry["future"])
+        finally:
+            entry["waiters"] -= 1
+            # 所有等待方都已放弃时停止查询该上传
+            if entry["waiters"] == 0 and self._pending.get(preupload_id) is entry:
+                del self._pending[preupload_id]
+                if not entry["future"].done():
+                    entry["future"].cancel()
+
+    def pending_count(self) -> int:
+        """
+        等待中的上传数量
+        """
+        return len(self._pending)
+
+    async def _run(self):
+        """
+        调度任务：等待最早到期的上传，然后并发查询所有已到期的上传
+        """
+        try:
+            while self._pending:
+                now = time.monotonic()
+                next_at = min(entry["next_at"] for entry in self._pending.values())
+                if next_at > now:
+                    self._wakeup.clear()
+                    try:
+                        # 有新的上传加入时提前醒来重新计算
+                        await asyncio.wait_for(self._wakeup.wait(), timeout=next_at - now)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+
+                due = [(preupload_id, entry) for preupload_id, entry in self._pending.items()
+                       if entry["next_at"] <= now]
+                await asyncio.gather(*(self._poll(preupload_id, entry) for preupload_id, entry in due))
+
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"[CloudImg123-API] 异步上传调度异常: {str(e)}")
+            for preupload_id, entry in list(self._pending.items()):
+                self._finish(preupload_id, entry, {"success": False, "message": f"异步上传异常: {str(e)}"})
+
+    async def _poll(self, preupload_id: str, entry: Dict[str, Any]):
+        """
+        查询一个上传的状态，未完成时按退避安排下一次查询
+        """
+        try:
+            result = await self.query(preupload_id)
+        except Exception as e:
+            logger.warning(f"[CloudImg123-API] 查询异步上传结果异常 {preupload_id}: {str(e)}")
+            result = None
+
+        if result is not None:
+            if result.get("success") is False:
+                self._finish(preupload_id, entry, result)
+                return
+            if result.get("completed") and result.get("file_id"):
+                self._finish(preupload_id, entry, {"success": True, "file_id": result["file_id"]})
+                return
+
+        now = time.monotonic()
+        if now >= entry["deadline"]:
+            self._finish(preupload_id, entry, {"success": False, "message": "异步上传超时"})
+            return
+
+        entry["delay"] = min(entry["delay"] * self.factor, self.max_delay)
+        entry["next_at"] = min(now + self._jittered(entry["delay"]), entry["deadline"])
+        logger.debug(f"[CloudImg123-API] 异步上传未完成 {preupload_id}，{entry['delay']:.1f} 秒后再次查询")
+
+    def _finish(self, preupload_id: str, entry: Dict[str, Any], result: Dict[str, Any]):
+        """
+        结束等待并通知所有等待方
+        """
+        if self._pending.get(preupload_id) is entry:
+            del self._pending[preupload_id]
+        if not entry["future"].done():
+            entry["future"].set_result(result)
+
+    def close(self):
+        """
+        停止调度任务，等待中的上传均以失败结束
+        """
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        try:
+            loop.call_soon_threadsafe(self._shutdown)
+        except RuntimeError:
+            pass
+
+    def _shutdown(self):
+        """
+        在所属事件循环上取消调度任务并结束所有等待
+        """
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+        self._task = None
+        for preupload_id, entry in list(self._pending.items()):
+            self._finish(preupload_id, entry, {"success": False, "message": "上传跟踪已停止"})
@@ -245,4 +245,13 @@ def create_success_response(data: Any = None, message: str = "操作成功") ->
     if data is not None:
         response["data"] = data
     
-    return response
\ No newline at end of file
+    return response
+
+
+def normalize_file_id(file_id: Any) -> str:
+    """
+    将file_id统一为字符串
+
+    123云盘接口返回的fileID为数字，数据库中以TEXT保存，内存索引和缓存一律以字符串为键
+    """
+    return str(file_id) if file_id is not None else ""